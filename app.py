@@ -4,7 +4,8 @@ from idlelib import query
 
 import pymysql
 import pymysql.cursors
-from flask import Flask, jsonify, request, render_template, url_for, redirect, session
+from flask import Flask, Response, abort, jsonify, request, render_template, url_for, redirect, send_from_directory, session, stream_with_context
+import itertools
 import math
 import os
 import warnings
@@ -12,15 +13,29 @@ from dotenv import load_dotenv
 from authlib.integrations.flask_client import OAuth
 import random
 import requests
+import threading
 import json
+from assets import AssetManifest
+from db_pool import ConnectionPool, PoolTimeout
+from catalog import CatalogVersion
+from export import export_rows, gzip_chunks, ndjson_chunks, parse_since
+from metrics import CallbackCounter, CallbackGauge, instrument_app, instrumented, observe_pool_wait, outbound, registry
+from notifications import DiscordDispatcher
+from package_cache import PackageCache, fetch_by_ids, fetch_by_names, hydrate
+from pagination import SORT_ORDERS, InvalidCursor, count_cache, fetch_page, paginate_ids
+from response_cache import ResponseCache, cached_response
+from responses import DATE_FORMATS, json_response, parse_fields, project, select_columns
+from search_index import SearchIndex, seeded_order
+from stats import CatalogStats
 load_dotenv()
 
+# static assets, fingerprinted and precompressed into static/build by
+# `python assets.py`, built here only if that manifest is missing or stale
+asset_manifest = AssetManifest("static", "static/build").load_or_build()
+served_assets = asset_manifest.served_files()
+
 # backgrounds
-backgrounds_unfiltered = os.listdir("static/img/backgrounds")
-backgrounds_filtered = []
-for i in range(len(backgrounds_unfiltered)):
-    if backgrounds_unfiltered[i] != ".DS_Store":
-        backgrounds_filtered.append("static/img/backgrounds/" + backgrounds_unfiltered[i])
+backgrounds_filtered = asset_manifest.backgrounds()
 
 try:
     host = os.environ.get("MYSQL_HOST")
@@ -34,6 +49,43 @@ try:
     port = int(os.environ.get("PORT"))
 except:
     warnings.warn("failed to load environment variables")
+
+db_pool = ConnectionPool({"host": host, "user": user, "password": password, "database": db_name},
+                         min_size=int(os.environ.get("MYSQL_POOL_MIN", 1)),
+                         max_size=int(os.environ.get("MYSQL_POOL_MAX", 10)),
+                         recycle=int(os.environ.get("MYSQL_POOL_RECYCLE", 3600)),
+                         timeout=float(os.environ.get("MYSQL_POOL_TIMEOUT", 10)),
+                         cursor_wrapper=instrumented,
+                         wait_observer=observe_pool_wait)
+
+search_index = SearchIndex(refresh_interval=int(os.environ.get("SEARCH_INDEX_REFRESH", 30)))
+response_cache = ResponseCache(max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)),
+                               ttl=int(os.environ.get("RESPONSE_CACHE_TTL", 60)))
+
+discord_dispatcher = DiscordDispatcher(os.environ.get("DISCORD_PAYLOAD_URL", "http://127.0.0.1:4747/discord_payload"),
+                                       workers=int(os.environ.get("DISCORD_WORKERS", 2)),
+                                       max_queue=int(os.environ.get("DISCORD_QUEUE_SIZE", 1000)),
+                                       max_batch=int(os.environ.get("DISCORD_MAX_BATCH", 10)),
+                                       timeout=float(os.environ.get("DISCORD_TIMEOUT", 5)))
+
+catalog = CatalogVersion(poll_interval=int(os.environ.get("CATALOG_POLL_INTERVAL", 5)))
+catalog.on_change(count_cache.clear)
+catalog.on_change(response_cache.clear)
+package_cache = PackageCache(max_entries=int(os.environ.get("PACKAGE_CACHE_SIZE", 5000)),
+                             ttl=int(os.environ.get("PACKAGE_CACHE_TTL", 300)))
+MAX_BATCH = int(os.environ.get("MAX_BATCH", 200))
+# exports stream over their own database connections, this bounds how many
+export_slots = threading.BoundedSemaphore(int(os.environ.get("EXPORT_MAX_CONCURRENT", 4)))
+
+catalog_stats = CatalogStats(refresh_interval=int(os.environ.get("CATALOG_STATS_REFRESH", 60)))
+
+catalog.on_change(search_index.invalidate)
+search_index.run_in_background(db_pool, before_refresh=lambda: catalog.check(db_pool))
+catalog.on_change(catalog_stats.invalidate)
+catalog.on_change(package_cache.clear)
+
+BACKGROUND_WIDTH = int(os.environ.get("BACKGROUND_WIDTH", 1920))
+
 app = Flask(__name__)
 
 app.secret_key = secret_key
@@ -49,26 +101,138 @@ github = oauth.register("github",
                api_base_url="https://api.github.com",
                client_kwargs={"scope": "openid profile email"})
 
+slow_request_ms = os.environ.get("SLOW_REQUEST_MS")
+instrument_app(app, slow_request_ms=float(slow_request_ms) if slow_request_ms else None)
+
+DISCORD_COUNTERS = ("enqueued", "sent", "batches", "retries", "failed", "dropped")
+
+registry.register(CallbackGauge("shrimplenaut_pool_connections", "Database pool connections by state.",
+                                lambda: {(state,): db_pool.stats()[state] for state in ("idle", "in_use")}, ("state",)))
+registry.register(CallbackCounter("shrimplenaut_pool_checkouts_total", "Connections handed out by the pool.",
+                                  lambda: db_pool.stats()["checkouts"]))
+registry.register(CallbackCounter("shrimplenaut_pool_timeouts_total", "Checkouts that timed out waiting for a connection.",
+                                  lambda: db_pool.stats()["timeouts"]))
+registry.register(CallbackCounter("shrimplenaut_pool_discarded_total", "Connections closed by the pool by reason.",
+                                  lambda: {("recycled",): db_pool.stats()["recycled"],
+                                           ("failed_health_check",): db_pool.stats()["failed_health_checks"]},
+                                  ("reason",)))
+registry.register(CallbackCounter("shrimplenaut_cache_lookups_total", "Cache lookups by cache and result.",
+                                  lambda: {(name, result): cache.stats()[result]
+                                           for name, cache in (("response", response_cache), ("package", package_cache))
+                                           for result in ("hits", "misses")}, ("cache", "result")))
+registry.register(CallbackGauge("shrimplenaut_cache_entries", "Entries held by each cache.",
+                                lambda: {(name,): cache.stats()["entries"]
+                                         for name, cache in (("response", response_cache), ("package", package_cache))},
+                                ("cache",)))
+registry.register(CallbackCounter("shrimplenaut_discord_notifications_total", "Discord notification dispatch counters.",
+                                  lambda: {(key,): discord_dispatcher.stats()[key] for key in DISCORD_COUNTERS},
+                                  ("event",)))
+registry.register(CallbackGauge("shrimplenaut_discord_queue_depth", "Discord notifications waiting to be sent.",
+                                lambda: discord_dispatcher.stats()["queued"]))
+registry.register(CallbackGauge("shrimplenaut_catalog_version", "Catalog version counter.", lambda: catalog.version))
+registry.register(CallbackGauge("shrimplenaut_search_index_documents", "Packages in the search index.",
+                                lambda: len(search_index.docs)))
+
+@app.context_processor
+def asset_helpers():
+    return {"asset_url": asset_url, "background_url": background_url}
+
+def asset_url(source):
+    name = asset_manifest.resolve(source)
+    if name is None:
+        return url_for("static", filename=source)
+    return url_for("assets", filename=name)
+
+def background_url(source):
+    if not source:
+        return ""
+    accepted = [fmt for fmt in ("avif", "webp") if any(value == f"image/{fmt}" for value, _ in request.accept_mimetypes)]
+    # every background is already a webp, so browsers that don't advertise it still get one
+    name = asset_manifest.best_background(source, accepted or ["webp"], width=BACKGROUND_WIDTH)
+    if name is None:
+        return url_for("static", filename=source)
+    return url_for("assets", filename=name)
+
+def catalog_version():
+    try:
+        return catalog.check(db_pool)
+    except pymysql.MySQLError:
+        return None
+
+def database_error(e):
+    # an exhausted pool is overload rather than a failure, so tell clients
+    # to come back shortly instead of handing them a 500
+    if isinstance(e, PoolTimeout):
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    return jsonify({"error": f"Database error: {e}"}), 500
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return database_error(e)
+
+def random_seed():
+    seed = request.args.get("seed", type=int)
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    return seed
+
+def search_ids(cursor, query, filters=None, sort_by=None, seed=None):
+    search_index.ensure_fresh(cursor)
+    ids = search_index.search(query, filters)
+    if sort_by == "random":
+        ids = seeded_order(ids, seed)
+    elif sort_by == "id":
+        ids.sort()
+    elif sort_by in SORT_ORDERS:
+        column, direction = SORT_ORDERS[sort_by]
+        ids = search_index.sort_ids(ids, column, descending=direction == "DESC")
+    return ids
+
+def batch_lookup(cursor, ids, names, fields=None):
+    ids = list(dict.fromkeys(str(package_id).strip() for package_id in ids if str(package_id).strip()))
+    names = list(dict.fromkeys(str(name).strip() for name in names if str(name).strip()))
+    if len(ids) + len(names) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} ids and names can be requested at once")
+
+    numeric_ids = [int(package_id) for package_id in ids if package_id.isdigit()]
+    by_id = fetch_by_ids(cursor, package_cache, numeric_ids) if numeric_ids else {}
+    by_name = fetch_by_names(cursor, package_cache, names) if names else {}
+
+    return {
+        "ids": {package_id: project(by_id[int(package_id)], fields) for package_id in ids if package_id.isdigit() and int(package_id) in by_id},
+        "names": {name: project(by_name[name], fields) for name in names if name in by_name},
+        "not_found": {
+            "ids": [package_id for package_id in ids if not package_id.isdigit() or int(package_id) not in by_id],
+            "names": [name for name in names if name not in by_name]
+        }
+    }
+
 @app.route("/")
 def index():
-    db = pymysql.connect(host=host,
-                         user=user,
-                         password=password,
-                         database=db_name)
-    cursor = db.cursor(pymysql.cursors.DictCursor)
-
-    cursor.execute("SELECT COUNT(*) AS total_count FROM packages")
-    total_items = cursor.fetchone()
+    catalog_stats.ensure_fresh(db_pool)
 
     github_profile = session.get("github_profile", None)
 
     return render_template("index.html",
-                           package_count=total_items["total_count"],
+                           package_count=catalog_stats.package_count,
                            github_profile=github_profile,
                            random_background=random.choice(backgrounds_filtered),
                            custom_script=""
                            )
 
+@app.route("/assets/<path:filename>")
+def assets(filename):
+    if filename not in served_assets:
+        abort(404)
+    encoded, encoding = asset_manifest.encoded_file(filename, request.accept_encodings)
+    response = send_from_directory(asset_manifest.build_dir, encoded, mimetype=asset_manifest.mimetype(filename))
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    # file names change with their content, so they can be cached forever
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
 @app.route("/login")
 def login():
     redirect_uri = url_for("authorize", _external=True)
@@ -82,9 +246,11 @@ def logout():
 
 @app.route("/authorize")
 def authorize():
-    token = github.authorize_access_token()
+    with outbound("github_token"):
+        token = github.authorize_access_token()
     # you can save the token into database
-    profile = github.get("/user", token=token).json()
+    with outbound("github_user"):
+        profile = github.get("/user", token=token).json()
     session["github_profile"] = {
         "avatar_url": profile["avatar_url"],
         "username": profile["login"],
@@ -96,7 +262,7 @@ def authorize():
 
 @app.route("/usage")
 def usage():
-    return render_template("usage.html")
+    return render_template("usage.html", random_background=random.choice(backgrounds_filtered))
 
 @app.route("/my_packages")
 def my_packages():
@@ -107,51 +273,33 @@ def my_packages():
     author = github_profile["id"]
 
     try:
-        db = pymysql.connect(host=host, user=user, password=password, database=db_name)
-        cursor = db.cursor(pymysql.cursors.DictCursor)
+        with db_pool.cursor() as cursor:
+            page = request.args.get("page", default=1, type=int)
+            per_page = min(request.args.get("per_page", default=10, type=int), 100)
+            after = request.args.get("cursor", type=str)
+            sort_by = request.args.get("sort_by", type=str)
+            count = request.args.get("count", default="exact" if after is None else "none", type=str)
 
-        page = request.args.get("page", default=1, type=int)
-        per_page = min(request.args.get("per_page", default=10, type=int), 100)
-        offset = (page - 1) * per_page
+            github_profile = session.get("github_profile", None)
 
-        github_profile = session.get("github_profile", None)
+            base_query = "FROM packages"
+            where_clauses = ["author = %s"]
+            params = [f"{author}"]
 
-        base_query = "FROM packages"
-        where_clauses = ["author = %s"]
-        params = [f"{author}"]
-
-        where_sql = ""
-        if where_clauses:
-            where_sql = "WHERE " + " AND ".join(where_clauses)
-
-        count_query = f"SELECT COUNT(*) AS total_count {base_query} {where_sql}"
-        cursor.execute(count_query, tuple(params))
-        total_items = cursor.fetchone()["total_count"]
-        total_pages = math.ceil(total_items / per_page) if total_items > 0 else 0
-
-        offset = (page - 1) * per_page
-        data_query = f"SELECT * {base_query} {where_sql} LIMIT %s OFFSET %s"
-        final_params = tuple(params) + (per_page, offset)
-        cursor.execute(data_query, final_params)
-        rows = cursor.fetchall()
+            rows, pagination = fetch_page(cursor, base_query, where_clauses, params, page=page, per_page=per_page,
+                                          sort_by=sort_by, after=after, count=count)
 
         results = {
             "items": rows,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total_items": total_items,
-                "total_pages": total_pages
-            }
+            "pagination": pagination
         }
 
-        return render_template("my_packages.html", github_profile=github_profile, results=results, random_background=random.choice(backgrounds_filtered),)
+        return render_template("my_packages.html", github_profile=github_profile, results=results, sort_by=sort_by, random_background=random.choice(backgrounds_filtered),)
 
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
     except pymysql.MySQLError as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-    finally:
-        if "db" in locals() and db.open:
-            db.close()
+        return database_error(e)
 
 @app.route("/submit_package")
 def submit_package():
@@ -160,6 +308,7 @@ def submit_package():
 
 
 @app.route("/packages")
+@cached_response(response_cache, catalog_version, max_age=int(os.environ.get("PACKAGES_MAX_AGE", 30)), compress=True)
 def packages():
     page = request.args.get("page", default=1, type=int)
     per_page = min(request.args.get("per_page", default=10, type=int), 100)
@@ -170,90 +319,145 @@ def packages():
     server_platform = request.args.get("server_platform", type=str)
     project_type = request.args.get("project_type", type=str)
     search = request.args.get("search", type=str)
+    sort_by = request.args.get("sort_by", type=str)
+    after = request.args.get("cursor", type=str)
+    count = request.args.get("count", default="exact" if after is None else "none", type=str)
 
-    try:
-        db = pymysql.connect(host=host, user=user, password=password, database=db_name)
-        cursor = db.cursor(pymysql.cursors.DictCursor)
-
-        if id:
-            cursor.execute("SELECT * FROM packages WHERE id = %s", (id,))
-            rows = cursor.fetchall()
-            return jsonify({
-                "items": rows,
-                "pagination": {
-                    "page": 1,
-                    "per_page": len(rows),
-                    "total_items": len(rows),
-                    "total_pages": 1 if rows else 0
-                }
-            })
-
-        base_query = "FROM packages"
-        where_clauses = []
-        params = []
-
-        if search:
-            where_clauses.append("name LIKE %s")
-            params.append(f"%{search}%")
-
-        filters = {
-            "tag": tag,
-            "name": name,
-            "license": license,
-            "server_platform": server_platform,
-            "project_type": project_type
-        }
-
-        for column, value in filters.items():
-            if value is not None:
-                where_clauses.append(f"{column} = %s")
-                params.append(value)
+    ids = request.args.get("ids", type=str)
+    names = request.args.get("names", type=str)
+    dates = request.args.get("dates", default="http", type=str)
 
+    try:
+        fields = parse_fields(request.args.get("fields", type=str))
+        if dates not in DATE_FORMATS:
+            raise ValueError(f"dates must be one of {', '.join(DATE_FORMATS)}")
+
+        with db_pool.cursor() as cursor:
+            if ids or names:
+                return json_response(batch_lookup(cursor, (ids or "").split(","), (names or "").split(","), fields), dates)
+
+            if id:
+                rows = list(fetch_by_ids(cursor, package_cache, [int(id)]).values()) if id.isdigit() else []
+                rows = [project(row, fields) for row in rows]
+                return json_response({
+                    "items": rows,
+                    "pagination": {
+                        "page": 1,
+                        "per_page": len(rows),
+                        "total_items": len(rows),
+                        "total_pages": 1 if rows else 0
+                    }
+                }, dates)
+
+            base_query = "FROM packages"
+            where_clauses = []
+            params = []
+
+            filters = {
+                "tag": tag,
+                "name": name,
+                "license": license,
+                "server_platform": server_platform,
+                "project_type": project_type
+            }
 
-        where_sql = ""
-        if where_clauses:
-            where_sql = "WHERE " + " AND ".join(where_clauses)
+            if search:
+                seed = random_seed() if sort_by == "random" else None
+                ids, pagination = paginate_ids(search_ids(cursor, search, filters, sort_by, seed), page=page, per_page=per_page, after=after)
+                if seed is not None:
+                    pagination["seed"] = seed
+                return json_response({
+                    "items": [project(row, fields) for row in hydrate(cursor, package_cache, ids)],
+                    "pagination": pagination
+                }, dates)
+
+            for column, value in filters.items():
+                if value is not None:
+                    where_clauses.append(f"{column} = %s")
+                    params.append(value)
+
+
+            rows, pagination = fetch_page(cursor, base_query, where_clauses, params, page=page, per_page=per_page,
+                                          sort_by=sort_by, after=after, count=count,
+                                          columns=select_columns(fields, sort_by))
+
+        return json_response({
+            "items": [project(row, fields) for row in rows],
+            "pagination": pagination
+        }, dates)
+
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except pymysql.MySQLError as e:
+        return database_error(e)
 
-        count_query = f"SELECT COUNT(*) AS total_count {base_query} {where_sql}"
-        cursor.execute(count_query, tuple(params))
-        total_items = cursor.fetchone()["total_count"]
-        total_pages = math.ceil(total_items / per_page) if total_items > 0 else 0
+@app.route("/packages/batch", methods=["POST"])
+def packages_batch():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("ids", []), list) or not isinstance(body.get("names", []), list):
+        return jsonify({"error": "expected a json object with ids and/or names lists"}), 400
+    try:
+        with db_pool.cursor() as cursor:
+            return json_response(batch_lookup(cursor, body.get("ids", []), body.get("names", [])))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except pymysql.MySQLError as e:
+        return database_error(e)
 
+@app.route("/packages/facets")
+@cached_response(response_cache, catalog_version, max_age=int(os.environ.get("PACKAGES_MAX_AGE", 30)))
+def package_facets():
+    try:
+        catalog_stats.ensure_fresh(db_pool)
+    except pymysql.MySQLError as e:
+        return database_error(e)
+    return jsonify(catalog_stats.snapshot())
 
-        offset = (page - 1) * per_page
-        data_query = f"SELECT * {base_query} {where_sql} LIMIT %s OFFSET %s"
-        final_params = tuple(params) + (per_page, offset)
-        cursor.execute(data_query, final_params)
-        rows = cursor.fetchall()
+@app.route("/packages/export")
+def export_packages():
+    try:
+        since = parse_since(request.args.get("since"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify({
-            "items": rows,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total_items": total_items,
-                "total_pages": total_pages
-            }
-        })
+    if not export_slots.acquire(blocking=False):
+        return jsonify({"error": "too many exports running, try again shortly"}), 503, {"Retry-After": "30"}
 
+    rows = export_rows(db_pool, since)
+    try:
+        # pull the first row now so connection and query errors still get a
+        # proper error response instead of a truncated stream
+        first = next(rows, None)
     except pymysql.MySQLError as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-    finally:
-        if "db" in locals() and db.open:
-            db.close()
+        export_slots.release()
+        return database_error(e)
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    chunks = ndjson_chunks(rows, app.json.dumps)
+    headers = {}
+    mimetype = "application/x-ndjson"
+    if request.args.get("format") == "gzip":
+        chunks = gzip_chunks(chunks)
+        mimetype = "application/gzip"
+        headers["Content-Disposition"] = "attachment; filename=packages.ndjson.gz"
+    elif request.accept_encodings.best_match(["gzip"]):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+    # runs when the server closes the stream, whether it finished or the client went away
+    response.call_on_close(export_slots.release)
+    return response
 
 @app.route("/search", methods=["GET"])
 def search():
     try:
-        db = pymysql.connect(host=host,
-                             user=user,
-                             password=password,
-                             database=db_name)
-        cursor = db.cursor(pymysql.cursors.DictCursor)
-
         page = request.args.get("page", default=1, type=int)
         per_page = min(request.args.get("per_page", default=10, type=int), 100)
-        offset = (page - 1) * per_page
+        after = request.args.get("cursor", type=str)
+        count = request.args.get("count", default="exact" if after is None else "none", type=str)
         query = request.args.get("search_query")
         sorting_query = request.args.get("sort_by")
 
@@ -263,54 +467,36 @@ def search():
         where_clauses = []
         params = []
 
-        where_clauses.append("name LIKE %s")
-        params.append(f"%{query}%")
-
-        sorting_sql = "ORDER BY id ASC"
-        if sorting_query == "upload_date_asc":
-            sorting_sql = "ORDER BY created_at ASC"
-        if sorting_query == "upload_date_desc":
-            sorting_sql = "ORDER BY created_at DESC"
-        if sorting_query == "updated_asc":
-            sorting_sql = "ORDER BY last_updated ASC"
-        if sorting_query == "updated_desc":
-            sorting_sql = "ORDER BY last_updated DESC"
-        if sorting_query == "random":
-            sorting_sql = "ORDER BY RAND()"
-
-        where_sql = ""
-        if where_clauses:
-            where_sql = "WHERE " + " AND ".join(where_clauses)
-
-        count_query = f"SELECT COUNT(*) AS total_count {base_query} {where_sql}"
-        cursor.execute(count_query, tuple(params))
-        total_items = cursor.fetchone()["total_count"]
-        total_pages = math.ceil(total_items / per_page) if total_items > 0 else 0
-
-        offset = (page - 1) * per_page
-        data_query = f"SELECT * {base_query} {where_sql} {sorting_sql} LIMIT %s OFFSET %s"
-        final_params = tuple(params) + (per_page, offset)
-        cursor.execute(data_query, final_params)
-        rows = cursor.fetchall()
+        # random order is a seeded permutation of the cached id list, so every
+        # page is a primary key fetch and paging with the same seed is stable
+        seed = random_seed() if sorting_query == "random" else None
+
+        with db_pool.cursor() as cursor:
+            if query:
+                ids, pagination = paginate_ids(search_ids(cursor, query, sort_by=sorting_query, seed=seed), page=page, per_page=per_page, after=after)
+                rows = hydrate(cursor, package_cache, ids)
+            elif seed is not None:
+                search_index.ensure_fresh(cursor)
+                ids, pagination = paginate_ids(search_index.random_ids(seed), page=page, per_page=per_page, after=after)
+                rows = hydrate(cursor, package_cache, ids)
+            else:
+                rows, pagination = fetch_page(cursor, base_query, where_clauses, params, page=page, per_page=per_page,
+                                              sort_by=sorting_query, after=after, count=count)
+        if seed is not None:
+            pagination["seed"] = seed
 
         results = {
             "items": rows,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total_items": total_items,
-                "total_pages": total_pages
-            }
+            "pagination": pagination
         }
 
 
-        return render_template("results.html", github_profile=github_profile, results=results, query=query, random_background=random.choice(backgrounds_filtered))
+        return render_template("results.html", github_profile=github_profile, results=results, query=query, sort_by=sorting_query, seed=seed, random_background=random.choice(backgrounds_filtered))
 
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
     except pymysql.MySQLError as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-    finally:
-        if "db" in locals() and db.open:
-            db.close()
+        return database_error(e)
 
 @app.route("/submit_package_for_approval", methods=["GET"])
 def submit_package_for_approval():
@@ -324,38 +510,35 @@ def submit_package_for_approval():
     package_icon = request.args.get("package_icon")
 
     github_profile = session.get("github_profile", None)
-    db = pymysql.connect(host=host,
-                         user=user,
-                         password=password,
-                         database=db_name)
-    cursor = db.cursor(pymysql.cursors.DictCursor)
+    if github_profile == None:
+        return "You are not logged in!"
     values = (package_name, github_profile["id"], project_type, current_version, versions_tested, repository_url, license, tag, package_icon)
-    if github_profile != None:
-        try:
+    try:
+        with db_pool.cursor() as cursor:
             command_prep = "INSERT INTO not_approved (name, author, project_type, current_version,versions_tested, repository_url, license, tag, package_icon) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
             cursor.execute(command_prep, values)
-            db.commit()
-
-        except pymysql.MySQLError as e:
-            return jsonify({"error": f"Database error: {e}"}), 500
-    cursor.execute("SELECT COUNT(*) AS total_count FROM packages")
-    total_items = cursor.fetchone()
-    if "db" in locals() and db.open:
-        db.close()
+            cursor.connection.commit()
+    except pymysql.MySQLError as e:
+        return database_error(e)
 
-    url = 'http://127.0.0.1:4747/discord_payload'
+    discord_dispatcher.submit(values)
     try:
-        discord_payload = requests.post(url, json=values)
-    except:
-        print("Discord payload error")
+        catalog_stats.ensure_fresh(db_pool)
+    except pymysql.MySQLError:
+        # the submission is already saved, a missing package count shouldn't turn that into an error
+        app.logger.exception("catalog stats unavailable after a submission")
 
     return render_template("index.html",
-                           package_count=total_items["total_count"],
+                           package_count=catalog_stats.package_count,
                            github_profile=github_profile,
                            random_background=random.choice(backgrounds_filtered),
                            custom_script="The package has been submitted for approval"
                            )
 
+@app.route("/metrics")
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     oauth.init_app(app)
     app.run(debug=False, port=port)
\ No newline at end of file
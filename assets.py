@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+    features = None
+
+IGNORED_FILES = {".DS_Store"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".ico", ".woff", ".ttf", ".json", ".txt"}
+IMAGE_EXTENSIONS = {".webp", ".png", ".jpg", ".jpeg"}
+BACKGROUND_DIR = "img/backgrounds/"
+BACKGROUND_WIDTHS = (1280, 1920)
+IMAGE_QUALITY = {"avif": 50, "webp": 75}
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprint(path, digest):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def atomic_write(path, write):
+    # every worker process may build at the same time, so write to a private
+    # temporary file and rename it into place, readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def image_formats():
+    if Image is None:
+        return []
+    return [fmt for fmt in ("avif", "webp") if features.check(fmt)]
+
+
+class AssetManifest:
+    def __init__(self, static_dir="static", build_dir="static/build"):
+        self.static_dir = static_dir
+        self.build_dir = build_dir
+        self.files = {}
+        self.encodings = {}
+        self.variants = {}
+
+    def _write(self, name, data):
+        path = os.path.join(self.build_dir, name)
+        # outputs are content addressed, so anything already on disk is current
+        if not os.path.exists(path):
+            atomic_write(path, lambda f: f.write(data))
+        return path
+
+    def _sources(self):
+        build = os.path.abspath(self.build_dir)
+        for root, dirs, files in os.walk(self.static_dir):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != build]
+            for filename in files:
+                if filename in IGNORED_FILES:
+                    continue
+                path = os.path.join(root, filename)
+                yield os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+
+    def _compress(self, name, data):
+        encodings = []
+        if len(data) < 1024:
+            return encodings
+        # encoded files are named after the content hash too, so existing ones
+        # are reused instead of paying for gzip 9 and brotli 11 on every start
+        existing = [encoding for encoding, suffix in (("gzip", ".gz"), ("br", ".br"))
+                    if os.path.exists(os.path.join(self.build_dir, name + suffix))]
+        if existing:
+            return existing
+        compressed = gzip.compress(data, 9, mtime=0)
+        if len(compressed) < len(data) * 0.9:
+            self._write(name + ".gz", compressed)
+            encodings.append("gzip")
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data) * 0.9:
+                self._write(name + ".br", compressed)
+                encodings.append("br")
+        return encodings
+
+    def _rewrite_css(self, source, data):
+        base = os.path.dirname(source)
+
+        def replace(match):
+            target = match.group(2)
+            if re.match(r"^(?:[a-z]+:|/|#)", target):
+                return match.group(0)
+            resolved = os.path.normpath(os.path.join(base, target)).replace(os.sep, "/")
+            if resolved not in self.files:
+                return match.group(0)
+            relative = os.path.relpath(self.files[resolved], os.path.dirname(fingerprint(source, "x")))
+            return f"url('{relative.replace(os.sep, '/')}')"
+
+        return CSS_URL_RE.sub(replace, data.decode()).encode()
+
+    def _background_variants(self, source, path, name):
+        with Image.open(path) as image:
+            image.load()
+            original = {"width": image.width, "format": image.format.lower(), "file": name,
+                        "bytes": os.path.getsize(path)}
+            variants = [original]
+            source_digest = name.rsplit(".", 2)[-2]
+            root = os.path.splitext(source)[0]
+            widths = sorted({min(width, image.width) for width in BACKGROUND_WIDTHS})
+            for width in widths:
+                height = round(image.height * width / image.width)
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                for fmt in image_formats():
+                    quality = IMAGE_QUALITY[fmt]
+                    name_base = f"{root}-{width}w.{fmt}"
+                    variant_name = fingerprint(name_base, content_hash(f"{source_digest}:{name_base}:q{quality}".encode()))
+                    variant_path = os.path.join(self.build_dir, variant_name)
+                    if not os.path.exists(variant_path):
+                        atomic_write(variant_path, lambda f: resized.save(f, fmt.upper(), quality=quality))
+                    size = os.path.getsize(variant_path)
+                    # re-encoding doesn't always win, only keep variants smaller than the original
+                    if size < original["bytes"]:
+                        variants.append({"width": width, "format": fmt, "file": variant_name, "bytes": size})
+        return variants
+
+    def build(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        sources = sorted(self._sources())
+        # css last so its url() references can point at the fingerprinted files
+        sources.sort(key=lambda source: source.endswith(".css"))
+        for source in sources:
+            path = os.path.join(self.static_dir, source)
+            with open(path, "rb") as f:
+                data = f.read()
+            if source.endswith(".css"):
+                data = self._rewrite_css(source, data)
+            name = fingerprint(source, content_hash(data))
+            self._write(name, data)
+            self.files[source] = name
+            if os.path.splitext(source)[1].lower() in COMPRESSIBLE:
+                self.encodings[name] = self._compress(name, data)
+            if source.startswith(BACKGROUND_DIR) and os.path.splitext(source)[1].lower() in IMAGE_EXTENSIONS:
+                try:
+                    if Image is not None:
+                        self.variants[source] = self._background_variants(source, path, name)
+                except OSError:
+                    # an image Pillow can't read still gets served as the original
+                    self.variants[source] = []
+
+        manifest = json.dumps({"files": self.files, "encodings": self.encodings, "variants": self.variants},
+                              indent=2, sort_keys=True)
+        atomic_write(os.path.join(self.build_dir, "manifest.json"), lambda f: f.write(manifest.encode()))
+        return self
+
+    def load(self):
+        # the manifest written by a previous build (normally `python assets.py`
+        # during deploy), None if it's missing or older than any static file
+        path = os.path.join(self.build_dir, "manifest.json")
+        try:
+            built_at = os.path.getmtime(path)
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        sources = set(self._sources())
+        if sources != set(manifest["files"]) or any(
+                os.path.getmtime(os.path.join(self.static_dir, source)) > built_at for source in sources):
+            return None
+        self.files = manifest["files"]
+        self.encodings = manifest["encodings"]
+        self.variants = manifest["variants"]
+        return self
+
+    def load_or_build(self):
+        return self.load() or self.build()
+
+    def backgrounds(self):
+        return sorted(source for source in self.files
+                      if source.startswith(BACKGROUND_DIR) and os.path.splitext(source)[1].lower() in IMAGE_EXTENSIONS)
+
+    def resolve(self, source):
+        return self.files.get(source)
+
+    def best_background(self, source, accepted_formats, width=1920):
+        candidates = [variant for variant in self.variants.get(source, []) if variant["format"] in accepted_formats]
+        if not candidates:
+            return self.files.get(source)
+        # the narrowest size that still covers the target width, then the smallest file at that size
+        covering = [variant for variant in candidates if variant["width"] >= width]
+        if covering:
+            target = min(variant["width"] for variant in covering)
+        else:
+            target = max(variant["width"] for variant in candidates)
+        return min((variant for variant in candidates if variant["width"] == target),
+                   key=lambda variant: variant["bytes"])["file"]
+
+    def encoded_file(self, name, accepted_encodings):
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in self.encodings.get(name, []) and accepted_encodings[encoding]:
+                return name + suffix, encoding
+        return name, None
+
+    def mimetype(self, name):
+        return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    def served_files(self):
+        names = set(self.files.values())
+        for variants in self.variants.values():
+            names.update(variant["file"] for variant in variants)
+        return names
+
+
+if __name__ == "__main__":
+    # prebuild during deploy so the first app start doesn't pay for image encoding
+    manifest = AssetManifest().build()
+    print(f"built {len(manifest.served_files())} assets into {manifest.build_dir}")
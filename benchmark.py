@@ -0,0 +1,438 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pymysql
+import pymysql.cursors
+
+from migrations import NOT_APPROVED_DDL, PACKAGE_INDEXES, PACKAGES_DDL, migrate
+
+TAGS = ["Economy", "Library", "Management", "Minigame", "Chat", "Cursed", "Misc", "Utility and Tools", "Game Mechanics"]
+LICENSES = ["MIT", "GPL-3.0", "Apache-2.0", "LGPL-3.0", "BSD-3-Clause", "Unlicense"]
+SERVER_PLATFORMS = ["endstone", "leviLamina"]
+PROJECT_TYPES = ["plugin", "addon", "vAddon", "structure"]
+NAME_WORDS = ["Economy", "Pilot", "Chat", "Guard", "Mini", "Games", "Land", "Claim", "Shop", "UI", "Auction", "House",
+              "Bedrock", "Warp", "Home", "Teleport", "Skyblock", "Quest", "Kit", "Rank", "Vault", "Party", "Duel",
+              "Arena", "Spawn", "Fly", "Nick", "Mail", "Trade", "Market", "Bounty", "Crate", "Key", "Pet", "Hat"]
+SORT_MODES = ["upload_date_asc", "upload_date_desc", "updated_asc", "updated_desc", "random"]
+PACKAGE_COLUMNS = ["id", "name", "author", "project_type", "current_version", "versions_tested", "repository_url",
+                   "license", "tag", "package_icon", "server_platform", "description", "created_at", "last_updated"]
+
+# in-process stand-in for MySQL: a sqlite file behind a pymysql shaped
+# connection, enough for the queries app.py generates
+
+# pymysql hands DATETIME columns back as datetime objects, so the stand-in
+# does too, and binds datetimes the way MySQL would store them
+sqlite3.register_adapter(datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+class StandinCursor:
+    def __init__(self, connection, dict_rows=True):
+        self.connection = connection
+        self.dict_rows = dict_rows
+        self._cursor = connection._db.cursor()
+        self.rowcount = -1
+        self.description = None
+
+    def execute(self, query, args=None):
+        try:
+            self._cursor.execute(query.replace("%s", "?"), tuple(args or ()))
+        except sqlite3.Error as e:
+            raise pymysql.err.ProgrammingError(str(e))
+        self.description = self._cursor.description
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def _row(self, row):
+        if row is None or not self.dict_rows:
+            return row
+        return dict(zip([column[0] for column in self.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandinConnection:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.open = True
+
+    def cursor(self, cursor_class=None):
+        dict_rows = cursor_class is None or issubclass(cursor_class, pymysql.cursors.DictCursorMixin)
+        # keep any mixins layered on top of the pymysql class, such as the metrics instrumentation
+        mixins = tuple(base for base in (cursor_class.__bases__ if cursor_class else ())
+                       if not base.__module__.startswith("pymysql"))
+        cls = type("StandinCursor", mixins + (StandinCursor,), {}) if mixins else StandinCursor
+        return cls(self, dict_rows=dict_rows)
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise pymysql.err.OperationalError("connection closed")
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def close(self):
+        self.open = False
+        self._db.close()
+
+
+def standin_connect(path):
+    def connect(**kwargs):
+        return StandinConnection(path)
+    return connect
+
+
+def sqlite_ddl(ddl):
+    return (ddl.replace("INT NOT NULL AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+               .replace(" ON UPDATE CURRENT_TIMESTAMP", ""))
+
+
+# seeding
+
+def synthetic_packages(rows, seed):
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    span = 3 * 365 * 24 * 3600
+    for package_id in range(1, rows + 1):
+        created_at = start + timedelta(seconds=rng.randrange(span))
+        last_updated = created_at + timedelta(seconds=rng.randrange(180 * 24 * 3600))
+        name = " ".join(rng.sample(NAME_WORDS, rng.randint(1, 3)))
+        yield (package_id, f"{name} {package_id}", str(rng.randrange(max(rows // 20, 1))),
+               rng.choice(PROJECT_TYPES), f"{rng.randint(0, 3)}.{rng.randint(0, 20)}.{rng.randint(0, 9)}",
+               "1.21.50", f"https://github.com/example/package-{package_id}", rng.choice(LICENSES),
+               rng.choice(TAGS), "", rng.choice(SERVER_PLATFORMS), f"A {name.lower()} package for Bedrock servers.",
+               created_at.strftime("%Y-%m-%d %H:%M:%S"), last_updated.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def seed_database(conn, rows, seed, sqlite=False, batch=5000):
+    cursor = conn.cursor()
+    if sqlite:
+        for ddl in (PACKAGES_DDL, NOT_APPROVED_DDL):
+            cursor.execute(sqlite_ddl(ddl))
+        for name, columns in PACKAGE_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON packages ({', '.join(columns)})")
+    else:
+        migrate(conn)
+    cursor.execute("DELETE FROM packages")
+    cursor.execute("DELETE FROM not_approved")
+    placeholders = ", ".join(["%s"] * len(PACKAGE_COLUMNS))
+    insert = f"INSERT INTO packages ({', '.join(PACKAGE_COLUMNS)}) VALUES ({placeholders})"
+    if sqlite:
+        insert = insert.replace("%s", "?")
+    chunk = []
+    for row in synthetic_packages(rows, seed):
+        chunk.append(row)
+        if len(chunk) >= batch:
+            cursor.executemany(insert, chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(insert, chunk)
+    conn.commit()
+
+
+# scenarios, each returns a request generator taking an rng
+
+def scenarios(rows):
+    def deep_page(rng, per_page):
+        pages = max(rows // per_page, 1)
+        return rng.randint(max(int(pages * 0.9), 1), pages)
+
+    def packages_filters(rng):
+        params = [f"per_page={rng.choice([10, 50, 100])}"]
+        for column, values in (("tag", TAGS), ("license", LICENSES), ("server_platform", SERVER_PLATFORMS),
+                               ("project_type", PROJECT_TYPES)):
+            if rng.random() < 0.4:
+                params.append(f"{column}={rng.choice(values)}")
+        params.append(f"page={rng.randint(1, 5)}")
+        return "GET", "/packages?" + "&".join(params)
+
+    # there are only a few deep pages, so without a unique parameter the
+    # response cache would answer nearly all of these instead of the OFFSET
+    # and COUNT queries they are meant to time
+    def packages_deep(rng):
+        return "GET", f"/packages?per_page=100&page={deep_page(rng, 100)}&bust={rng.getrandbits(32)}"
+
+    def packages_count_estimate(rng):
+        return "GET", f"/packages?per_page=100&page={deep_page(rng, 100)}&count=estimate&bust={rng.getrandbits(32)}"
+
+    def search(sort_by):
+        def generate(rng):
+            query = " ".join(rng.sample(NAME_WORDS, rng.randint(1, 2)))
+            extra = f"&seed={rng.randrange(100)}" if sort_by == "random" else ""
+            return "GET", f"/search?search_query={query}&sort_by={sort_by}&page={rng.randint(1, 3)}{extra}"
+        return generate
+
+    def search_typo(rng):
+        word = rng.choice(NAME_WORDS)
+        typo = "".join(letter for letter in word if letter.lower() not in "aeiou" or rng.random() < 0.5)
+        return "GET", f"/packages?search={typo}"
+
+    def batch(rng):
+        ids = ",".join(str(rng.randint(1, rows)) for _ in range(50))
+        return "GET", f"/packages?ids={ids}"
+
+    def submit(rng):
+        return "GET", (f"/submit_package_for_approval?package_name=Bench {rng.randrange(10 ** 6)}"
+                       f"&project_type=plugin&current_version=1.0.0&repository_url=https://example.com"
+                       f"&license=MIT&versions_tested=1.21.50&tag={rng.choice(TAGS)}&package_icon=")
+
+    named = {
+        "index": lambda rng: ("GET", "/"),
+        "packages_filters": packages_filters,
+        "packages_deep_pages": packages_deep,
+        "packages_deep_pages_estimate": packages_count_estimate,
+        "packages_search_typo": search_typo,
+        "packages_batch": batch,
+    }
+    for sort_by in SORT_MODES:
+        named[f"search_{sort_by}"] = search(sort_by)
+    # submissions only write to not_approved, they don't change the catalog
+    # version or clear any cache the read scenarios use
+    named["submit"] = submit
+    return named
+
+
+# drivers
+
+class TestClientDriver:
+    def __init__(self, app_module):
+        self.app = app_module.app
+        self._local = threading.local()
+
+    def client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+            with client.session_transaction() as session:
+                session["github_profile"] = {"avatar_url": "", "username": "bench", "followers": 0, "id": 1}
+        return client
+
+    def request(self, method, path):
+        response = self.client().open(path, method=method)
+        response.get_data()
+        return response.status_code
+
+
+class HttpDriver:
+    def __init__(self, base_url, cookie=None):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.cookie = cookie
+        self._requests = requests
+        self._local = threading.local()
+
+    def request(self, method, path):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+            if self.cookie:
+                session.headers["Cookie"] = self.cookie
+        response = session.request(method, self.base_url + path, timeout=60)
+        return response.status_code
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_scenario(driver, generate, concurrency, requests_total, seed):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(worker_id, count):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker_id)
+        local = []
+        local_errors = 0
+        for _ in range(count):
+            method, path = generate(rng)
+            start = time.perf_counter()
+            try:
+                status = driver.request(method, path)
+            except Exception:
+                status = None
+            local.append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    per_worker = [requests_total // concurrency + (1 if i < requests_total % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for worker_id, count in enumerate(per_worker):
+            executor.submit(worker, worker_id, count)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(previous, current):
+    print(f"\ncompared with {previous['meta'].get('commit')}:")
+    for key, result in current["results"].items():
+        old = previous["results"].get(key)
+        if not old or not old.get("p95_ms") or not result.get("p95_ms"):
+            continue
+        p95 = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        rps = (result["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100
+        print(f"  {key:<45} p95 {p95:+7.1f}%  throughput {rps:+7.1f}%")
+
+
+def load_app(args):
+    # the app reads its config, builds its assets from static/ and builds
+    # its pool on import; only that import runs from the repo root with
+    # the missing config warnings silenced, the caller's cwd and warning
+    # filters are left alone
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            import app as app_module
+    finally:
+        os.chdir(cwd)
+    app_module.app.secret_key = app_module.app.secret_key or "benchmark"
+    app_module.discord_dispatcher.url = args.discord_url
+    app_module.discord_dispatcher.retries = 0
+    return app_module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a synthetic catalog and benchmark the shrimplenaut routes.")
+    parser.add_argument("--rows", type=int, default=10000, help="packages to seed (10k to 1M)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and request mixes")
+    parser.add_argument("--mysql", action="store_true", help="seed and use the MySQL/MariaDB from the MYSQL_* env vars instead of the in-process stand-in")
+    parser.add_argument("--no-seed", action="store_true", help="reuse the existing data")
+    parser.add_argument("--url", help="drive a running server over HTTP instead of in-process")
+    parser.add_argument("--cookie", help="session cookie for --url so submissions are logged in")
+    parser.add_argument("--discord-url", default="http://127.0.0.1:9/discord_payload", help="where in-process submissions notify")
+    parser.add_argument("--no-response-cache", action="store_true", help="disable the /packages response cache so every request hits the database")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--scenarios", help="comma separated scenario names, default all")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results json to compare against")
+    args = parser.parse_args(argv)
+
+    sqlite_path = None
+    if args.url is None and not args.mysql:
+        sqlite_path = os.path.join(tempfile.gettempdir(), f"shrimplenaut-bench-{args.rows}-{args.seed}.sqlite3")
+
+    if not args.no_seed and (args.mysql or sqlite_path):
+        started = time.perf_counter()
+        if sqlite_path:
+            conn = sqlite3.connect(sqlite_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            seed_database(conn, args.rows, args.seed, sqlite=True)
+        else:
+            conn = pymysql.connect(host=os.environ.get("MYSQL_HOST"), user=os.environ.get("MYSQL_USER"),
+                                   password=os.environ.get("MYSQL_PASSWORD"), database=os.environ.get("MYSQL_DB"))
+            seed_database(conn, args.rows, args.seed)
+        conn.close()
+        print(f"seeded {args.rows} packages in {time.perf_counter() - started:.1f}s")
+
+    if args.url:
+        driver = HttpDriver(args.url, args.cookie)
+    else:
+        app_module = load_app(args)
+        if sqlite_path:
+            app_module.db_pool.connect = standin_connect(sqlite_path)
+        if args.no_response_cache:
+            # the cache is bound to the views at import, so empty it in place
+            app_module.response_cache.max_entries = 0
+        driver = TestClientDriver(app_module)
+
+    available = scenarios(args.rows)
+    names = args.scenarios.split(",") if args.scenarios else list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    if args.url and not args.cookie and "submit" in names and not args.scenarios:
+        names.remove("submit")
+
+    # one untimed request per scenario so index builds and cache fills aren't measured
+    for name in names:
+        driver.request(*available[name](random.Random(args.seed)))
+
+    results = {}
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        for name in names:
+            key = f"{name}@{concurrency}"
+            results[key] = run_scenario(driver, available[name], concurrency, args.requests, args.seed)
+            result = results[key]
+            print(f"{key:<45} {result['throughput_rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+                  f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "rows": args.rows,
+            "seed": args.seed,
+            "backend": "http" if args.url else ("mysql" if args.mysql else "standin"),
+            "requests_per_run": args.requests,
+            "python": sys.version.split()[0],
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nwrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+
+
+if __name__ == "__main__":
+    main()
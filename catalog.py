@@ -0,0 +1,40 @@
+import threading
+
+from refresher import Refresher
+
+
+class CatalogVersion:
+    # packages are approved and edited outside this app, so changes are
+    # detected by polling a cheap signature of the packages table
+    def __init__(self, poll_interval=5):
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._signature = None
+        self._poll = Refresher(poll_interval)
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def on_change(self, callback):
+        self._listeners.append(callback)
+        return callback
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+        for callback in self._listeners:
+            callback()
+
+    def _poll_signature(self, pool):
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS total_count, MAX(id) AS max_id, MAX(last_updated) AS last_updated FROM packages")
+            row = cursor.fetchone()
+        signature = (row["total_count"], row["max_id"], row["last_updated"])
+        changed = self._signature is not None and signature != self._signature
+        self._signature = signature
+        if changed:
+            self.bump()
+
+    def check(self, pool):
+        # one thread polls, the others carry on with the version they know
+        self._poll.run(lambda: self._poll_signature(pool))
+        return self.version
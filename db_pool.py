@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+import pymysql.cursors
+
+
+class PoolTimeout(pymysql.MySQLError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, recycle=3600, timeout=10.0,
+                 cursor_wrapper=None, wait_observer=None, connect=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("invalid pool size")
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.recycle = recycle
+        self.timeout = timeout
+        self.cursor_wrapper = cursor_wrapper
+        self.wait_observer = wait_observer
+        self.connect = connect or pymysql.connect
+
+        self._idle = deque()
+        self._size = 0
+        self._filled = False
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+        self._checkouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._failed_checks = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = self.connect(**self.connect_kwargs)
+        conn._pool_created_at = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _fill(self):
+        # open the minimum number of connections on first use, not on import,
+        # so the app can still start while the database is unreachable; the
+        # slots are reserved under the lock and connected outside it, like
+        # any other new connection
+        with self._available:
+            if self._filled:
+                return
+            self._filled = True
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+        while missing:
+            missing -= 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._available:
+                    self._size -= missing + 1
+                    self._available.notify(missing + 1)
+                break
+            with self._available:
+                self._created += 1
+                self._idle.append(conn)
+                self._available.notify()
+
+    def _healthy(self, conn):
+        if time.monotonic() - conn._pool_created_at > self.recycle:
+            with self._lock:
+                self._recycled += 1
+            return False
+        try:
+            conn.ping(reconnect=False)
+        except Exception:
+            with self._lock:
+                self._failed_checks += 1
+            return False
+        return True
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        if not self._filled:
+            self._fill()
+        with self._available:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout("timed out waiting for a database connection")
+                self._available.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        if self.wait_observer is not None:
+            self.wait_observer(waited)
+
+        # health check and connect outside the lock so a slow server
+        # doesn't block every other thread waiting on the pool
+        if conn is not None and not self._healthy(conn):
+            self._discard(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._available:
+                    self._size -= 1
+                    self._available.notify()
+                raise
+            with self._lock:
+                self._created += 1
+        return conn
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                # end any open transaction so the next borrower doesn't
+                # inherit uncommitted writes or a stale snapshot
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._available:
+            if broken or not conn.open:
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except pymysql.err.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    @contextmanager
+    def cursor(self, cursor_class=pymysql.cursors.DictCursor):
+        if self.cursor_wrapper is not None:
+            cursor_class = self.cursor_wrapper(cursor_class)
+        with self.connection() as conn:
+            cursor = conn.cursor(cursor_class)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def dedicated_cursor(self, cursor_class=pymysql.cursors.DictCursor):
+        # a connection of its own for reads that last as long as a client
+        # download, so slow clients can't hold the connections other routes need
+        if self.cursor_wrapper is not None:
+            cursor_class = self.cursor_wrapper(cursor_class)
+        conn = self._connect()
+        try:
+            cursor = conn.cursor(cursor_class)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        finally:
+            self._discard(conn)
+
+    def close(self):
+        with self._available:
+            while self._idle:
+                self._size -= 1
+                self._discard(self._idle.pop())
+            self._filled = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "created": self._created,
+                "recycled": self._recycled,
+                "failed_health_checks": self._failed_checks,
+                "timeouts": self._timeouts,
+                "wait_total_seconds": round(self._wait_total, 6),
+                "wait_avg_seconds": round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+                "wait_max_seconds": round(self._wait_max, 6),
+            }
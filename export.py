@@ -0,0 +1,63 @@
+import zlib
+from datetime import datetime, timezone
+
+import pymysql.cursors
+from werkzeug.http import parse_date
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_since(value):
+    # accept both the ISO form and the HTTP date form /packages renders datetimes in
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is not None:
+        return parsed.replace(tzinfo=None)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("since must be an ISO 8601 or HTTP date")
+    # last_updated is stored as naive UTC and pymysql drops tzinfo, so apply the offset here
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def export_rows(pool, since=None):
+    # SSDictCursor streams rows from the server instead of buffering the
+    # whole result set, so memory stays flat however big the catalog gets
+    with pool.dedicated_cursor(pymysql.cursors.SSDictCursor) as cursor:
+        if since is None:
+            cursor.execute("SELECT * FROM packages ORDER BY id")
+        else:
+            # >= so rows sharing the watermark timestamp are sent again rather than missed;
+            # a deleted package has no row left to send, so a delta export can never
+            # report it and mirrors have to reconcile against a periodic full export
+            cursor.execute("SELECT * FROM packages WHERE last_updated >= %s ORDER BY last_updated, id", (since,))
+        for row in cursor:
+            yield row
+
+
+def ndjson_chunks(rows, dumps):
+    buffer = []
+    size = 0
+    for row in rows:
+        line = dumps(row) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
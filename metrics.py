@@ -0,0 +1,256 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pymysql.cursors
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+
+    def collect(self):
+        with self._lock:
+            snapshot = {key: (list(counts), self._sums[key]) for key, counts in self._counts.items()}
+        for key, (counts, total) in sorted(snapshot.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class CallbackGauge:
+    kind = "gauge"
+
+    # fn returns a dict of {labels tuple: value} or a single value
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def collect(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class CallbackCounter(CallbackGauge):
+    # for totals another object already keeps, like the pool's timeouts
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.collect():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    "shrimplenaut_request_duration_seconds", "Request latency by route.", ("route", "method", "status")))
+sql_duration = registry.register(Histogram(
+    "shrimplenaut_sql_duration_seconds", "SQL statement execution time by statement shape.", ("statement",)))
+sql_rows = registry.register(Histogram(
+    "shrimplenaut_sql_rows", "Rows returned or affected by statement shape.", ("statement",), buckets=ROW_BUCKETS))
+sql_errors = registry.register(Counter(
+    "shrimplenaut_sql_errors_total", "SQL statements that raised an error.", ("statement",)))
+template_duration = registry.register(Histogram(
+    "shrimplenaut_template_render_seconds", "Template render time.", ("template",)))
+http_duration = registry.register(Histogram(
+    "shrimplenaut_outbound_http_seconds", "Outbound HTTP call time by target.", ("target", "outcome")))
+pool_wait = registry.register(Histogram(
+    "shrimplenaut_pool_wait_seconds", "Time spent waiting to check out a database connection."))
+slow_requests = registry.register(Counter(
+    "shrimplenaut_slow_requests_total", "Requests slower than the slow request threshold.", ("route",)))
+
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(query):
+    # statements are built with placeholders, so the shape only varies with the
+    # filter combination, IN (...) lists are collapsed to keep the label set small
+    shape = WHITESPACE_RE.sub(" ", query).strip()
+    return IN_LIST_RE.sub("IN (...)", shape)[:200]
+
+
+def add_phase(phase, elapsed):
+    if has_request_context():
+        phases = g.get("phases")
+        if phases is not None:
+            phases[phase] += elapsed
+
+
+def observe_pool_wait(waited):
+    pool_wait.observe(waited)
+    add_phase("pool_wait", waited)
+
+
+class InstrumentedCursorMixin:
+    def execute(self, query, args=None):
+        shape = statement_shape(query)
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, args)
+        except Exception:
+            sql_errors.inc(statement=shape)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            sql_duration.observe(elapsed, statement=shape)
+            add_phase("db", elapsed)
+        # unbuffered cursors don't know their row count until they are drained
+        if not isinstance(self, pymysql.cursors.SSCursor) and self.rowcount is not None and self.rowcount >= 0:
+            sql_rows.observe(self.rowcount, statement=shape)
+        return result
+
+
+_instrumented_classes = {}
+
+
+def instrumented(cursor_class):
+    cls = _instrumented_classes.get(cursor_class)
+    if cls is None:
+        cls = type(f"Instrumented{cursor_class.__name__}", (InstrumentedCursorMixin, cursor_class), {})
+        _instrumented_classes[cursor_class] = cls
+    return cls
+
+
+@contextmanager
+def outbound(target):
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        http_duration.observe(elapsed, target=target, outcome=outcome)
+        add_phase("http", elapsed)
+
+
+def instrument_app(app, slow_request_ms=None):
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.phases = defaultdict(float)
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_duration.observe(elapsed, route=route, method=request.method, status=response.status_code)
+        if slow_request_ms is not None and elapsed * 1000 >= slow_request_ms:
+            slow_requests.inc(route=route)
+            phases = g.get("phases") or {}
+            breakdown = " ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in sorted(phases.items()))
+            other = elapsed - sum(phases.values())
+            app.logger.warning(f"slow request {request.method} {request.full_path.rstrip('?')} {response.status_code} "
+                               f"total={elapsed * 1000:.1f}ms {breakdown} other={other * 1000:.1f}ms")
+        return response
+
+    def template_started(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault("template_starts", {})[template.name] = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        if not has_request_context():
+            return
+        started = g.get("template_starts", {}).pop(template.name, None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            template_duration.observe(elapsed, template=template.name)
+            add_phase("template", elapsed)
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
@@ -0,0 +1,221 @@
+import itertools
+import os
+import sys
+
+import pymysql
+import pymysql.cursors
+from dotenv import load_dotenv
+
+from pagination import SORT_ORDERS, cursor_query, encode_cursor, keyset_clause, page_query
+from stats import FACETS
+
+PACKAGES_DDL = """CREATE TABLE IF NOT EXISTS packages (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    author VARCHAR(64) NOT NULL,
+    project_type VARCHAR(32),
+    current_version VARCHAR(64),
+    versions_tested VARCHAR(255),
+    repository_url VARCHAR(512),
+    license VARCHAR(64),
+    tag VARCHAR(64),
+    package_icon VARCHAR(512),
+    server_platform VARCHAR(32),
+    description TEXT,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_updated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+)"""
+NOT_APPROVED_DDL = """CREATE TABLE IF NOT EXISTS not_approved (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255),
+    author VARCHAR(64),
+    project_type VARCHAR(32),
+    current_version VARCHAR(64),
+    versions_tested VARCHAR(255),
+    repository_url VARCHAR(512),
+    license VARCHAR(64),
+    tag VARCHAR(64),
+    package_icon VARCHAR(512),
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+)"""
+
+# columns /packages filters on with equality, my_packages filters on author
+FILTER_COLUMNS = ("tag", "name", "license", "server_platform", "project_type")
+
+# InnoDB appends the primary key to every secondary index, so (tag) is really
+# (tag, id) and also serves the default ORDER BY id after the filter
+PACKAGE_INDEXES = {
+    "packages_tag": ("tag",),
+    "packages_name": ("name",),
+    "packages_license": ("license",),
+    "packages_server_platform": ("server_platform",),
+    "packages_project_type": ("project_type",),
+    "packages_author_created_at": ("author", "created_at"),
+    "packages_created_at": ("created_at",),
+    "packages_last_updated": ("last_updated",),
+    # covers the facet GROUP BY so it never touches the rows
+    "packages_facets": FACETS,
+}
+
+
+def index_exists(cursor, table, name):
+    cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (name,))
+    return cursor.fetchone() is not None
+
+
+def add_index(cursor, table, name, columns, kind="INDEX"):
+    # databases set up by hand may already have some of these
+    if not index_exists(cursor, table, name):
+        cursor.execute(f"ALTER TABLE {table} ADD {kind} {name} ({', '.join(columns)})")
+
+
+def create_tables(cursor):
+    cursor.execute(PACKAGES_DDL)
+    cursor.execute(NOT_APPROVED_DDL)
+
+
+def create_package_indexes(cursor):
+    for name, columns in PACKAGE_INDEXES.items():
+        add_index(cursor, "packages", name, columns)
+
+
+def create_fulltext_index(cursor):
+    add_index(cursor, "packages", "packages_fulltext", ("name", "description"), kind="FULLTEXT")
+
+
+# (version, description, step), versions are applied in order and never edited
+# once released, schema changes go in a new entry at the end
+MIGRATIONS = [
+    (1, "create packages and not_approved", create_tables),
+    (2, "filter, sort and facet indexes on packages", create_package_indexes),
+    (3, "fulltext index on packages name and description", create_fulltext_index),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""")
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cursor.fetchall()}
+
+
+def migrate(conn, target=None):
+    applied = []
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        done = applied_versions(cursor)
+        for version, description, step in MIGRATIONS:
+            if version in done or (target is not None and version > target):
+                continue
+            # MySQL commits DDL implicitly, so each step is recorded as soon as it finishes
+            step(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            conn.commit()
+            applied.append(version)
+    return applied
+
+
+def query_shapes(sample, watermark):
+    # every statement shape app.py and its helpers send to the database, as
+    # (label, query, params, full scan expected); sample is a packages row
+    # used for parameter values so the optimizer sees realistic selectivity,
+    # watermark a recent last_updated like the incremental reads use
+    shapes = []
+    for size in range(len(FILTER_COLUMNS) + 1):
+        for columns in itertools.combinations(FILTER_COLUMNS, size):
+            shapes.extend(list_shapes(columns, sample))
+    shapes.extend(list_shapes(("author",), sample))
+
+    shapes.append(("catalog signature",
+                   "SELECT COUNT(*) AS total_count, MAX(id) AS max_id, MAX(last_updated) AS last_updated FROM packages",
+                   (), False))
+    columns = ", ".join(FACETS)
+    shapes.append(("facet counts", f"SELECT {columns}, COUNT(*) AS total_count FROM packages GROUP BY {columns}", (), False))
+    shapes.append(("lookup by ids", "SELECT * FROM packages WHERE id IN (%s, %s)", (sample["id"], sample["id"] + 1), False))
+    shapes.append(("lookup by names", "SELECT * FROM packages WHERE name IN (%s, %s) ORDER BY id",
+                   (sample["name"], sample["name"] + "x"), False))
+    shapes.append(("search index refresh", "SELECT * FROM packages WHERE last_updated >= %s", (watermark,), False))
+    shapes.append(("export since", "SELECT * FROM packages WHERE last_updated >= %s ORDER BY last_updated, id",
+                   (watermark,), False))
+    # these read the whole catalog on purpose
+    shapes.append(("search index rebuild", "SELECT * FROM packages", (), True))
+    shapes.append(("export", "SELECT * FROM packages ORDER BY id", (), True))
+    return shapes
+
+
+def list_shapes(columns, sample):
+    label = "+".join(columns) or "unfiltered"
+    where_clauses = [f"{column} = %s" for column in columns]
+    params = [sample[column] for column in columns]
+    where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    shapes = [(f"count {label}", f"SELECT COUNT(*) AS total_count FROM packages {where_sql}", tuple(params), False)]
+    for sort_by in SORT_ORDERS:
+        shapes.append((f"page {label} {sort_by}", page_query("FROM packages", where_sql, sort_by),
+                       tuple(params) + (10, 0), False))
+        clause, keyset_params = keyset_clause(sort_by, encode_cursor(sort_by, sample))
+        keyset_sql = "WHERE " + " AND ".join(where_clauses + [clause])
+        shapes.append((f"cursor {label} {sort_by}", cursor_query("FROM packages", keyset_sql, sort_by),
+                       tuple(params + keyset_params) + (11,), False))
+    return shapes
+
+
+def check(conn, out=sys.stdout):
+    # EXPLAIN plans depend on table statistics, run this against a database
+    # with a realistic amount of data (benchmark.py --mysql can seed one)
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute("SELECT * FROM packages ORDER BY id LIMIT 1")
+        sample = cursor.fetchone()
+        if sample is None:
+            raise SystemExit("packages is empty, EXPLAIN plans on an empty table are meaningless")
+        cursor.execute("SELECT MAX(last_updated) AS last_updated FROM packages")
+        watermark = cursor.fetchone()["last_updated"]
+        failures = []
+        shapes = query_shapes(sample, watermark)
+        for label, query, params, full_scan_expected in shapes:
+            cursor.execute("EXPLAIN " + query, params)
+            plan = cursor.fetchall()
+            scans = [row for row in plan if row.get("type") == "ALL"]
+            keys = ",".join(str(row.get("key")) for row in plan)
+            if scans and not full_scan_expected:
+                failures.append(label)
+                print(f"FULL SCAN  {label}  rows={scans[0].get('rows')}  {query}", file=out)
+            else:
+                print(f"ok         {label}  key={keys}", file=out)
+    print(f"\n{len(shapes) - len(failures)}/{len(shapes)} query shapes use an index", file=out)
+    return failures
+
+
+def connect():
+    load_dotenv()
+    return pymysql.connect(host=os.environ.get("MYSQL_HOST"), user=os.environ.get("MYSQL_USER"),
+                           password=os.environ.get("MYSQL_PASSWORD"), database=os.environ.get("MYSQL_DB"))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "migrate"
+    conn = connect()
+    try:
+        if command == "migrate":
+            target = int(argv[1]) if len(argv) > 1 else None
+            applied = migrate(conn, target)
+            print(f"applied {', '.join(map(str, applied))}" if applied else "schema is up to date")
+        elif command == "status":
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                done = applied_versions(cursor)
+            for version, description, _ in MIGRATIONS:
+                print(f"{'applied' if version in done else 'pending'}  {version}  {description}")
+        elif command == "check":
+            if check(conn):
+                sys.exit(1)
+        else:
+            sys.exit("usage: python migrations.py [migrate [version] | status | check]")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import logging
+import queue
+import threading
+import time
+
+import requests
+
+from metrics import outbound
+
+logger = logging.getLogger(__name__)
+
+
+class DiscordDispatcher:
+    # what the bot at url receives: a single submission is posted as its flat
+    # json array of values, exactly like before batching; a burst is posted
+    # once as an object, {"submissions": [values, values, ...]}, so the bot can
+    # tell the two apart by the top level type instead of guessing from the
+    # contents of an array
+    def __init__(self, url, workers=2, max_queue=1000, max_batch=10, coalesce_window=0.5,
+                 timeout=5.0, retries=3, backoff=0.5, overflow="drop_oldest"):
+        if overflow not in ("drop_oldest", "drop_newest"):
+            raise ValueError("overflow must be drop_oldest or drop_newest")
+        self.url = url
+        self.workers = workers
+        self.max_batch = max_batch
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.overflow = overflow
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed": 0,
+            "dropped": 0
+        }
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _start(self):
+        # threads are started on first use rather than on import so forking
+        # servers don't end up with workers that only exist in the parent
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"discord-dispatch-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, payload):
+        self._start()
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self._count("dropped")
+            if self.overflow == "drop_newest":
+                return False
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(payload)
+            except queue.Full:
+                return False
+        self._count("enqueued")
+        return True
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.coalesce_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch):
+        body = batch[0] if len(batch) == 1 else {"submissions": batch}
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                with outbound("discord"):
+                    response = requests.post(self.url, json=body, timeout=self.timeout)
+                    response.raise_for_status()
+                self._count("sent", len(batch))
+                self._count("batches")
+                return True
+            except requests.RequestException as e:
+                error = e
+                if attempt == self.retries:
+                    break
+                self._count("retries")
+                time.sleep(self.backoff * 2 ** attempt)
+        self._count("failed", len(batch))
+        logger.error("discord notification to %s failed after %d attempts, dropping %d submissions: %s",
+                     self.url, self.retries + 1, len(batch), error)
+        return False
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._send(batch)
+            except Exception:
+                # a worker that dies takes its share of the queue with it
+                logger.exception("discord dispatcher failed to send %d submissions", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["workers"] = len(self._threads)
+        return stats
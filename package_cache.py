@@ -0,0 +1,78 @@
+from cache import LRUCache
+
+
+class PackageCache(LRUCache):
+    def __init__(self, max_entries=5000, ttl=300):
+        super().__init__(max_entries, ttl)
+        self._names = {}
+
+    def get_many(self, ids):
+        found = {}
+        with self._lock:
+            for package_id in ids:
+                row = self._lookup(package_id)
+                if row is not None:
+                    found[package_id] = row
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def get_names(self, names):
+        found = {}
+        with self._lock:
+            for name in names:
+                package_id = self._names.get(name)
+                row = self._lookup(package_id) if package_id is not None else None
+                if row is not None and row.get("name") == name:
+                    found[name] = row
+            self.hits += len(found)
+            self.misses += len(names) - len(found)
+        return found
+
+    def put(self, row):
+        with self._lock:
+            self._store(row["id"], row)
+            name = row.get("name")
+            # duplicate names resolve to the oldest package, same as the database lookup
+            if name is not None and (name not in self._names or self._names[name] not in self._entries
+                                     or row["id"] <= self._names[name]):
+                self._names[name] = row["id"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._names.clear()
+
+
+def fetch_by_ids(cursor, cache, ids):
+    found = cache.get_many(ids)
+    missing = [package_id for package_id in ids if package_id not in found]
+    if missing:
+        placeholders = ", ".join(["%s"] * len(missing))
+        cursor.execute(f"SELECT * FROM packages WHERE id IN ({placeholders})", tuple(missing))
+        for row in cursor.fetchall():
+            cache.put(row)
+            found[row["id"]] = row
+    return found
+
+
+def hydrate(cursor, cache, ids):
+    # rows for ids in the order given, skipping any that no longer exist
+    found = fetch_by_ids(cursor, cache, ids)
+    return [found[package_id] for package_id in ids if package_id in found]
+
+
+def fetch_by_names(cursor, cache, names):
+    found = cache.get_names(names)
+    missing = [name for name in names if name not in found]
+    if missing:
+        placeholders = ", ".join(["%s"] * len(missing))
+        cursor.execute(f"SELECT * FROM packages WHERE name IN ({placeholders}) ORDER BY id", tuple(missing))
+        # name comparisons in MySQL are case insensitive, key results by what was asked for
+        requested = {name.lower(): name for name in missing}
+        for row in cursor.fetchall():
+            cache.put(row)
+            name = requested.get((row["name"] or "").lower())
+            if name is not None:
+                found.setdefault(name, row)
+    return found
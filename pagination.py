@@ -0,0 +1,188 @@
+import base64
+import json
+import math
+
+from cache import LRUCache
+
+# sort_by value -> (column, direction); every order is tie-broken on id so
+# keyset cursors stay stable when several rows share a timestamp
+SORT_ORDERS = {
+    "id": ("id", "ASC"),
+    "upload_date_asc": ("created_at", "ASC"),
+    "upload_date_desc": ("created_at", "DESC"),
+    "updated_asc": ("last_updated", "ASC"),
+    "updated_desc": ("last_updated", "DESC"),
+}
+
+COUNT_MODES = ("exact", "estimate", "none")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CountCache(LRUCache):
+    def __init__(self, ttl=60, max_entries=1024):
+        super().__init__(max_entries, ttl)
+
+
+count_cache = CountCache()
+
+
+def sort_key(sort_by):
+    return sort_by if sort_by in SORT_ORDERS else "id"
+
+
+def order_by_sql(sort_by):
+    column, direction = SORT_ORDERS[sort_key(sort_by)]
+    if column == "id":
+        return f"ORDER BY id {direction}"
+    return f"ORDER BY {column} {direction}, id {direction}"
+
+
+def encode_cursor(sort_by, row):
+    sort_by = sort_key(sort_by)
+    column, _ = SORT_ORDERS[sort_by]
+    payload = {"s": sort_by, "id": row["id"]}
+    if column != "id":
+        payload["v"] = str(row[column])
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_by):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        last_id = int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("invalid cursor")
+    if payload.get("s") != sort_key(sort_by):
+        raise InvalidCursor("cursor does not match sort_by")
+    if SORT_ORDERS[payload["s"]][0] != "id" and "v" not in payload:
+        raise InvalidCursor("invalid cursor")
+    return payload.get("v"), last_id
+
+
+def keyset_clause(sort_by, cursor):
+    column, direction = SORT_ORDERS[sort_key(sort_by)]
+    value, last_id = decode_cursor(cursor, sort_by)
+    op = ">" if direction == "ASC" else "<"
+    if column == "id":
+        return f"id {op} %s", [last_id]
+    return f"({column} {op} %s OR ({column} = %s AND id {op} %s))", [value, value, last_id]
+
+
+def count_rows(cursor, base_query, where_sql, params, mode):
+    if mode == "none":
+        return None
+    key = (base_query, where_sql, tuple(params))
+    if mode == "estimate":
+        cached = count_cache.get(key)
+        if cached is not None:
+            return cached
+    cursor.execute(f"SELECT COUNT(*) AS total_count {base_query} {where_sql}", tuple(params))
+    total_items = cursor.fetchone()["total_count"]
+    count_cache.set(key, total_items)
+    return total_items
+
+
+def page_query(base_query, where_sql, sort_by=None, columns=None):
+    # the data statements fetch_page sends, shared with migrations.query_shapes
+    # so the EXPLAIN check runs against exactly these
+    select_sql = ", ".join(columns) if columns else "*"
+    return f"SELECT {select_sql} {base_query} {where_sql} {order_by_sql(sort_by)} LIMIT %s OFFSET %s"
+
+
+def cursor_query(base_query, where_sql, sort_by=None, columns=None):
+    select_sql = ", ".join(columns) if columns else "*"
+    return f"SELECT {select_sql} {base_query} {where_sql} {order_by_sql(sort_by)} LIMIT %s"
+
+
+def fetch_page(cursor, base_query, where_clauses, params, page=1, per_page=10, sort_by=None,
+               after=None, count="exact", columns=None):
+    where_clauses = list(where_clauses)
+    params = list(params)
+    if count not in COUNT_MODES:
+        count = "exact"
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+    total_items = count_rows(cursor, base_query, where_sql, params, count)
+    total_pages = None
+    if total_items is not None:
+        total_pages = math.ceil(total_items / per_page) if total_items > 0 else 0
+
+    if after is None:
+        # classic page/per_page mode, kept for existing clients
+        offset = (max(page, 1) - 1) * per_page
+        cursor.execute(page_query(base_query, where_sql, sort_by, columns), tuple(params) + (per_page, offset))
+        rows = cursor.fetchall()
+        return rows, {
+            "page": page,
+            "per_page": per_page,
+            "total_items": total_items,
+            "total_pages": total_pages
+        }
+
+    if after:
+        clause, keyset_params = keyset_clause(sort_by, after)
+        where_clauses.append(clause)
+        params.extend(keyset_params)
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+
+    cursor.execute(cursor_query(base_query, where_sql, sort_by, columns), tuple(params) + (per_page + 1,))
+    rows = list(cursor.fetchall())
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(sort_by, rows[-1])
+    return rows, {
+        "per_page": per_page,
+        "cursor": after,
+        "next_cursor": next_cursor,
+        "total_items": total_items,
+        "total_pages": total_pages
+    }
+
+
+def encode_offset_cursor(offset):
+    raw = json.dumps({"s": "offset", "o": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_offset_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        offset = int(payload["o"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("invalid cursor")
+    if payload.get("s") != "offset" or offset < 0:
+        raise InvalidCursor("invalid cursor")
+    return offset
+
+
+def paginate_ids(ids, page=1, per_page=10, after=None):
+    # ids is an already ranked in-memory list, so slicing it is cheap at any depth
+    total_items = len(ids)
+    total_pages = math.ceil(total_items / per_page) if total_items > 0 else 0
+    if after is None:
+        offset = (max(page, 1) - 1) * per_page
+        return ids[offset:offset + per_page], {
+            "page": page,
+            "per_page": per_page,
+            "total_items": total_items,
+            "total_pages": total_pages
+        }
+
+    offset = decode_offset_cursor(after) if after else 0
+    end = offset + per_page
+    return ids[offset:end], {
+        "per_page": per_page,
+        "cursor": after,
+        "next_cursor": encode_offset_cursor(end) if end < total_items else None,
+        "total_items": total_items,
+        "total_pages": total_pages
+    }
@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class Refresher:
+    # runs a refresh at most once per interval and only on one thread at a
+    # time; callers that find it running carry on with what they already
+    # have, except before the first successful run, when there is nothing
+    # to carry on with and they wait for it instead
+    def __init__(self, interval):
+        self.interval = interval
+        self.loaded = False
+        self._last_run = None
+        self._lock = threading.Lock()
+
+    def due(self):
+        return self._last_run is None or time.monotonic() - self._last_run >= self.interval
+
+    def mark(self):
+        self._last_run = time.monotonic()
+        self.loaded = True
+
+    def invalidate(self):
+        self._last_run = None
+
+    def run(self, fn):
+        if self.loaded and not self.due():
+            return False
+        if not self._lock.acquire(blocking=not self.loaded):
+            return False
+        try:
+            if self.loaded and not self.due():
+                return False
+            try:
+                fn()
+            except Exception:
+                if self.loaded:
+                    # wait a full interval before trying again, so an outage
+                    # doesn't add a failed query to every call
+                    self._last_run = time.monotonic()
+                raise
+            self.mark()
+            return True
+        finally:
+            self._lock.release()
@@ -0,0 +1,94 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request
+
+from cache import LRUCache
+from responses import COMPRESS_MIN_SIZE, compress as compress_body, negotiate_encoding
+
+
+class ResponseCache(LRUCache):
+    def __init__(self, max_entries=512, ttl=60):
+        super().__init__(max_entries, ttl)
+        self.not_modified = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None and entry["version"] != version:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def set(self, key, version, body, mimetype):
+        entry = {
+            "version": version,
+            "body": body,
+            "mimetype": mimetype,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "encoded": {}
+        }
+        with self._lock:
+            self._store(key, entry)
+        return entry
+
+    def encoded(self, entry, encoding):
+        # compressed once per entry, later hits reuse the stored bytes
+        body = entry["encoded"].get(encoding)
+        if body is None:
+            body = compress_body(entry["body"], encoding)
+            with self._lock:
+                entry["encoded"][encoding] = body
+        return body
+
+    def stats(self):
+        stats = super().stats()
+        stats["not_modified"] = self.not_modified
+        return stats
+
+
+def cache_key():
+    # argument order doesn't change the response, so ?a=1&b=2 and ?b=2&a=1 share an entry
+    return request.path + "?" + urlencode(sorted(request.args.items(multi=True)))
+
+
+def cached_response(cache, version, max_age=30, compress=False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = version()
+            if current is None:
+                return view(*args, **kwargs)
+            key = cache_key()
+            entry = cache.get(key, current)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = cache.set(key, current, response.get_data(), response.mimetype)
+
+            encoding = None
+            if compress and len(entry["body"]) >= COMPRESS_MIN_SIZE:
+                encoding = negotiate_encoding(request.accept_encodings)
+            if encoding is None:
+                response = Response(entry["body"], mimetype=entry["mimetype"])
+                response.set_etag(entry["etag"])
+            else:
+                response = Response(cache.encoded(entry, encoding), mimetype=entry["mimetype"])
+                response.headers["Content-Encoding"] = encoding
+                # each encoding is a different byte stream, so it gets its own etag
+                response.set_etag(f"{entry['etag']}-{encoding}")
+            if compress:
+                response.headers["Vary"] = "Accept-Encoding"
+            response.headers["Cache-Control"] = f"public, max-age={max_age}"
+            response = response.make_conditional(request)
+            if response.status_code == 304:
+                cache.not_modified += 1
+            return response
+        return wrapper
+    return decorator
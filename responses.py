@@ -0,0 +1,114 @@
+import gzip
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from flask import Response
+
+from pagination import SORT_ORDERS, sort_key
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the columns a package has, ?fields= may pick any of them
+PACKAGE_FIELDS = ("id", "name", "author", "project_type", "current_version", "versions_tested", "repository_url",
+                  "license", "tag", "package_icon", "server_platform", "description", "created_at", "last_updated")
+
+DATE_FORMATS = ("http", "iso")
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# below this the compressed body plus headers barely saves anything
+COMPRESS_MIN_SIZE = 1024
+
+
+def parse_fields(value):
+    if not value:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in PACKAGE_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def select_columns(fields, sort_by=None):
+    # without ?fields= every path reads SELECT *, so a listing and a lookup
+    # of the same package return the same keys
+    if fields is None:
+        return None
+    # keyset cursors are built from id and the sort column, so those are always read
+    column, _ = SORT_ORDERS[sort_key(sort_by)]
+    return tuple(dict.fromkeys(["id", column, *fields]))
+
+
+def project(row, fields):
+    if fields is None:
+        return row
+    return {field: row.get(field) for field in fields}
+
+
+def http_date(value):
+    # same output as werkzeug's http_date, formatted directly since it runs
+    # twice per package and strftime dominated the encode time
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        clock = f"{value.hour:02d}:{value.minute:02d}:{value.second:02d}"
+    else:
+        clock = "00:00:00"
+    return (f"{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} {value.year:04d} "
+            f"{clock} GMT")
+
+
+def http_default(value):
+    # renders dates the way flask's jsonify does, so the default output doesn't change
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def iso_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj, dates="http"):
+    if orjson is not None:
+        if dates == "iso":
+            # orjson writes datetimes itself, without calling back into python
+            return orjson.dumps(obj, default=iso_default, option=orjson.OPT_SORT_KEYS)
+        return orjson.dumps(obj, default=http_default,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    default = iso_default if dates == "iso" else http_default
+    return json.dumps(obj, default=default, sort_keys=True, separators=(",", ":")).encode()
+
+
+def json_response(obj, dates="http"):
+    return Response(dumps(obj, dates), mimetype="application/json")
+
+
+def negotiate_encoding(accept_encodings):
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return accept_encodings.best_match(offered)
+
+
+def compress(body, encoding):
+    # bodies are compressed once per cache entry, so a middling level is
+    # enough, the top levels cost several times the cpu for a few percent
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, 6, mtime=0)
@@ -0,0 +1,307 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from refresher import Refresher
+
+# columns kept on each indexed document so /packages filters and the
+# /search sort orders can be applied without going back to the database
+DOC_COLUMNS = ("name", "author", "tag", "license", "server_platform", "project_type", "created_at", "last_updated")
+
+SOUNDEX_CLASSES = {}
+for letters, code in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for letter in letters:
+        SOUNDEX_CLASSES[letter] = code
+
+NAME_WEIGHT = 1.0
+PHONETIC_WEIGHT = 0.8
+TEXT_WEIGHT = 0.3
+SUBSTRING_BONUS = 1.0
+MIN_SCORE = 0.25
+# grams posted by more than this share of the catalog (the padded "  e" of
+# a first letter, say) don't narrow anything down, so they only count
+# towards the score of candidates found through the rarer grams
+COMMON_GRAM_SHARE = 0.05
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+logger = logging.getLogger(__name__)
+
+PERMUTATION_CACHE_SIZE = 64
+MASK64 = (1 << 64) - 1
+
+
+def words(text):
+    return WORD_RE.findall((text or "").lower())
+
+
+def trigrams(text):
+    grams = set()
+    for word in words(text):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def phonetic_key(word):
+    # soundex-like consonant skeleton, but vowels don't split repeated codes
+    # and there is no 4 character limit, so "ecnmy" and "economy" share a key
+    if not word:
+        return ""
+    if word.isdigit():
+        return word
+    key = word[0].upper()
+    last = SOUNDEX_CLASSES.get(word[0])
+    for letter in word[1:]:
+        code = SOUNDEX_CLASSES.get(letter)
+        if code is not None and code != last:
+            key += code
+            last = code
+    return key
+
+
+def seeded_key(seed, package_id):
+    # splitmix64 of (seed, id); ordering by it is a seeded shuffle where
+    # adding or removing a package doesn't reorder the others
+    x = (seed * 0x9E3779B97F4A7C15 + package_id) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def seeded_order(ids, seed):
+    return sorted(ids, key=lambda package_id: seeded_key(seed, package_id))
+
+
+class SearchIndex:
+    def __init__(self, refresh_interval=30, rebuild_interval=3600):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+
+        self.docs = {}
+        self._name_grams = defaultdict(set)
+        self._text_grams = defaultdict(set)
+        self._phonetic = defaultdict(set)
+        self._doc_grams = {}
+        # casefolded names for the substring match name LIKE '%q%' used to do
+        self._names = {}
+        self._lock = threading.RLock()
+
+        # bumped only when ids are added or removed, edits don't change random orders
+        self.generation = 0
+        self._permutations = OrderedDict()
+
+        self._watermark = None
+        self._reconcile = False
+        self._last_rebuild = 0.0
+        self._refresher = Refresher(refresh_interval)
+
+        self._pool = None
+        self._before_refresh = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def _unindex(self, package_id):
+        name_grams, text_grams, keys = self._doc_grams.pop(package_id, (set(), set(), set()))
+        for gram in name_grams:
+            self._name_grams[gram].discard(package_id)
+        for gram in text_grams:
+            self._text_grams[gram].discard(package_id)
+        for key in keys:
+            self._phonetic[key].discard(package_id)
+        self._names.pop(package_id, None)
+        self.docs.pop(package_id, None)
+
+    def upsert(self, row):
+        package_id = row["id"]
+        name_grams = trigrams(row.get("name"))
+        text_grams = trigrams(f"{row.get('tag') or ''} {row.get('description') or ''}")
+        keys = {phonetic_key(word) for word in words(row.get("name"))}
+        with self._lock:
+            if package_id not in self.docs:
+                self.generation += 1
+            self._unindex(package_id)
+            for gram in name_grams:
+                self._name_grams[gram].add(package_id)
+            for gram in text_grams:
+                self._text_grams[gram].add(package_id)
+            for key in keys:
+                self._phonetic[key].add(package_id)
+            self._doc_grams[package_id] = (name_grams, text_grams, keys)
+            self._names[package_id] = (row.get("name") or "").casefold()
+            doc = {column: row.get(column) for column in DOC_COLUMNS}
+            doc["id"] = package_id
+            self.docs[package_id] = doc
+            last_updated = row.get("last_updated")
+            if last_updated is not None and (self._watermark is None or last_updated > self._watermark):
+                self._watermark = last_updated
+
+    def remove(self, package_id):
+        with self._lock:
+            if package_id in self.docs:
+                self.generation += 1
+            self._unindex(package_id)
+
+    def random_ids(self, seed):
+        with self._lock:
+            key = (self.generation, seed)
+            ids = self._permutations.get(key)
+            if ids is not None:
+                self._permutations.move_to_end(key)
+                return ids
+            ids = list(self.docs)
+        ids = seeded_order(ids, seed)
+        with self._lock:
+            self._permutations[key] = ids
+            while len(self._permutations) > PERMUTATION_CACHE_SIZE:
+                self._permutations.popitem(last=False)
+        return ids
+
+    def search(self, query, filters=None, limit=None):
+        query_words = words(query)
+        if not query_words:
+            return []
+        query_grams = trigrams(query)
+        query_keys = [phonetic_key(word) for word in query_words]
+        needle = " ".join(query_words)
+        substring = query.casefold()
+
+        with self._lock:
+            common = max(int(len(self.docs) * COMMON_GRAM_SHARE), 1)
+            postings = [self._name_grams.get(gram, ()) for gram in query_grams]
+            postings += [self._text_grams.get(gram, ()) for gram in query_grams]
+            candidates = set()
+            for posting in postings:
+                if len(posting) <= common:
+                    candidates.update(posting)
+            phonetic_hits = defaultdict(int)
+            for key in set(query_keys):
+                weight = query_keys.count(key)
+                for package_id in self._phonetic.get(key, ()):
+                    phonetic_hits[package_id] += weight
+            candidates.update(phonetic_hits)
+            # grams only start at word boundaries, so "co" never finds "Economy",
+            # a plain scan keeps every match the old LIKE query returned
+            substring_hits = {package_id for package_id, name in self._names.items() if substring in name}
+            candidates.update(substring_hits)
+            if not candidates:
+                # every gram is common, fall back to the rarest one that matches anything
+                candidates.update(min((posting for posting in postings if posting), key=len, default=()))
+
+            scored = []
+            for package_id in candidates:
+                doc = self.docs[package_id]
+                # MySQL's default collation compares case insensitively, so do the same
+                if filters and any(value is not None and str(doc.get(column)).casefold() != str(value).casefold()
+                                   for column, value in filters.items()):
+                    continue
+                name_grams, text_grams, _ = self._doc_grams[package_id]
+                shared = len(query_grams & name_grams)
+                score = NAME_WEIGHT * shared / (len(query_grams) + len(name_grams) - shared or 1)
+                score += PHONETIC_WEIGHT * phonetic_hits.get(package_id, 0) / len(query_keys)
+                score += TEXT_WEIGHT * len(query_grams & text_grams) / len(query_grams)
+                if package_id in substring_hits or needle in " ".join(words(doc["name"])):
+                    score += SUBSTRING_BONUS
+                if score >= MIN_SCORE:
+                    scored.append((score, package_id))
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        if limit is not None:
+            scored = scored[:limit]
+        return [package_id for _, package_id in scored]
+
+    def refresh(self, cursor, full=False):
+        with self._lock:
+            watermark = self._watermark
+            empty = not self.docs
+            reconcile = self._reconcile
+            self._reconcile = False
+        if full or empty or watermark is None:
+            cursor.execute("SELECT * FROM packages")
+            rows = cursor.fetchall()
+            # build the new index on the side so searches keep running against
+            # the current one, then swap it in
+            fresh = SearchIndex()
+            for row in rows:
+                fresh.upsert(row)
+            with self._lock:
+                if fresh.docs.keys() != self.docs.keys():
+                    self.generation += 1
+                self.docs = fresh.docs
+                self._name_grams = fresh._name_grams
+                self._text_grams = fresh._text_grams
+                self._phonetic = fresh._phonetic
+                self._doc_grams = fresh._doc_grams
+                self._names = fresh._names
+                self._watermark = fresh._watermark
+            self._last_rebuild = time.monotonic()
+        else:
+            # >= so rows sharing the watermark timestamp aren't missed, upsert is idempotent
+            cursor.execute("SELECT * FROM packages WHERE last_updated >= %s", (watermark,))
+            for row in cursor.fetchall():
+                self.upsert(row)
+            if reconcile:
+                # deletions don't show up in last_updated, so after a catalog
+                # change drop whatever is no longer in the table
+                cursor.execute("SELECT id FROM packages")
+                live = {row["id"] for row in cursor.fetchall()}
+                with self._lock:
+                    gone = [package_id for package_id in self.docs if package_id not in live]
+                for package_id in gone:
+                    self.remove(package_id)
+        self._refresher.mark()
+
+    def invalidate(self):
+        self._reconcile = True
+        self._refresher.invalidate()
+        self._wake.set()
+
+    def run_in_background(self, pool, before_refresh=None):
+        # once the first load is done, refreshes and hourly rebuilds run on a
+        # thread of their own so no request waits for them or holds a pooled
+        # connection meanwhile; before_refresh runs first on every round, the
+        # app polls the catalog there so deletions are noticed without traffic
+        # on the cached routes
+        self._pool = pool
+        self._before_refresh = before_refresh
+
+    def _start(self):
+        # started on first use rather than on import so forking servers
+        # don't end up with a thread that only exists in the parent
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="search-index-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.refresh_interval)
+            try:
+                if self._before_refresh is not None:
+                    self._before_refresh()
+                self._wake.clear()
+                with self._pool.cursor() as cursor:
+                    self.refresh(cursor, full=time.monotonic() - self._last_rebuild >= self.rebuild_interval)
+            except Exception:
+                logger.exception("search index refresh failed, serving the current index")
+
+    def ensure_fresh(self, cursor):
+        if self._refresher.loaded and self._pool is not None:
+            self._start()
+            return
+        self._refresher.run(lambda: self.refresh(
+            cursor, full=time.monotonic() - self._last_rebuild >= self.rebuild_interval))
+
+    def sort_ids(self, ids, column, descending=False):
+        with self._lock:
+            docs = [self.docs[package_id] for package_id in ids if package_id in self.docs]
+        missing = [doc["id"] for doc in docs if doc.get(column) is None]
+        docs = [doc for doc in docs if doc.get(column) is not None]
+        docs.sort(key=lambda doc: (doc[column], doc["id"]), reverse=descending)
+        return [doc["id"] for doc in docs] + missing
+
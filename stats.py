@@ -0,0 +1,60 @@
+import logging
+import time
+from collections import Counter
+
+import pymysql
+
+from refresher import Refresher
+
+FACETS = ("tag", "license", "project_type", "server_platform")
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogStats:
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self.package_count = 0
+        self.facets = {facet: {} for facet in FACETS}
+        self.refreshed_at = None
+        self._refresher = Refresher(refresh_interval)
+
+    def invalidate(self):
+        self._refresher.invalidate()
+
+    def refresh(self, cursor):
+        # one grouped query gives both the total and every facet count
+        columns = ", ".join(FACETS)
+        cursor.execute(f"SELECT {columns}, COUNT(*) AS total_count FROM packages GROUP BY {columns}")
+        counters = {facet: Counter() for facet in FACETS}
+        package_count = 0
+        for row in cursor.fetchall():
+            package_count += row["total_count"]
+            for facet in FACETS:
+                if row[facet] is not None:
+                    counters[facet][row[facet]] += row["total_count"]
+
+        self.facets = {facet: dict(counter.most_common()) for facet, counter in counters.items()}
+        self.package_count = package_count
+        self.refreshed_at = time.time()
+        self._refresher.mark()
+
+    def ensure_fresh(self, pool):
+        def refresh():
+            with pool.cursor() as cursor:
+                self.refresh(cursor)
+
+        try:
+            self._refresher.run(refresh)
+        except pymysql.MySQLError:
+            if not self._refresher.loaded:
+                raise
+            # stale counts beat an error page
+            logger.exception("catalog stats refresh failed, serving the previous counts")
+
+    def snapshot(self):
+        return {
+            "package_count": self.package_count,
+            "facets": self.facets,
+            "refreshed_at": self.refreshed_at
+        }
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import benchmark
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "packages.sqlite3")
+    conn = sqlite3.connect(path)
+    benchmark.seed_database(conn, 50, seed=1, sqlite=True)
+    conn.close()
+
+    class Args:
+        discord_url = "http://127.0.0.1:9/discord_payload"
+
+    app_module = benchmark.load_app(Args)
+    app_module.db_pool.close()
+    app_module.db_pool.connect = benchmark.standin_connect(path)
+    return app_module
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.response_cache.clear()
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        # every seeded package's author is in range(2), so this profile owns some
+        session["github_profile"] = {"avatar_url": "", "username": "test", "followers": 0, "id": 1}
+    return client
@@ -0,0 +1,5 @@
+def test_usage_page_gets_a_background(client):
+    page = client.get("/usage").get_data(as_text=True)
+    assert 'href="/static/"' not in page
+    assert "url(/static/)" not in page
+    assert "/assets/img/backgrounds/" in page
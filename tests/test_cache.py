@@ -0,0 +1,21 @@
+from cache import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = LRUCache(max_entries=2, ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,101 @@
+import pymysql
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.open = True
+        self.alive = True
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise pymysql.err.OperationalError("server has gone away")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+class FakeConnect:
+    def __init__(self):
+        self.connections = []
+        self.fail = False
+
+    def __call__(self, **kwargs):
+        if self.fail:
+            raise pymysql.err.OperationalError("can't connect")
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted():
+    pool = ConnectionPool({}, min_size=0, max_size=1, timeout=0.05, connect=FakeConnect())
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_old_connections_are_recycled():
+    connect = FakeConnect()
+    pool = ConnectionPool({}, min_size=1, max_size=1, recycle=60, connect=connect)
+    first = pool.acquire()
+    pool.release(first)
+    first._pool_created_at -= 120
+
+    second = pool.acquire()
+    assert second is not first
+    assert not first.open
+    assert pool.stats()["recycled"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_broken_connections_are_discarded():
+    connect = FakeConnect()
+    pool = ConnectionPool({}, min_size=1, max_size=2, connect=connect)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.alive = False
+
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert not conn.open
+    assert pool.stats()["failed_health_checks"] == 1
+
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection():
+            raise pymysql.err.OperationalError("lost connection")
+    assert pool.stats()["size"] == 1
+
+
+def test_failed_connect_gives_its_slot_back():
+    connect = FakeConnect()
+    connect.fail = True
+    pool = ConnectionPool({}, min_size=2, max_size=2, timeout=0.05, connect=connect)
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.acquire()
+    assert pool.stats()["size"] == 0
+
+    connect.fail = False
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    assert pool.stats()["size"] == 2
+    assert pool.stats()["in_use"] == 2
+
+
+def test_pool_timeout_is_a_503_with_retry_after(app_module, client, monkeypatch):
+    def exhausted():
+        raise PoolTimeout("timed out waiting for a database connection")
+
+    monkeypatch.setattr(app_module.db_pool, "acquire", exhausted)
+    response = client.get("/packages?id=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,26 @@
+import json
+import threading
+from datetime import datetime
+
+from export import parse_since
+
+
+def test_parse_since_applies_offset():
+    assert parse_since("2025-01-01T02:00:00+02:00") == datetime(2025, 1, 1, 0, 0, 0)
+    assert parse_since("2025-01-01T02:00:00") == datetime(2025, 1, 1, 2, 0, 0)
+    assert parse_since("Wed, 01 Jan 2025 00:00:00 GMT") == datetime(2025, 1, 1, 0, 0, 0)
+
+
+def test_export_uses_its_own_connection_and_caps_concurrency(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "export_slots", threading.BoundedSemaphore(1))
+
+    streaming = client.get("/packages/export", buffered=False)
+    assert streaming.status_code == 200
+    # the running export doesn't hold a pooled connection
+    assert app_module.db_pool.stats()["in_use"] == 0
+    assert client.get("/packages/export").status_code == 503
+
+    rows = [json.loads(line) for line in streaming.get_data(as_text=True).splitlines()]
+    streaming.close()
+    assert len(rows) == 50
+    assert client.get("/packages/export").status_code == 200
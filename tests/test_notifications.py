@@ -0,0 +1,25 @@
+import logging
+
+from notifications import DiscordDispatcher
+
+
+def test_failed_send_is_logged_and_counted(caplog):
+    dispatcher = DiscordDispatcher("http://127.0.0.1:9/discord_payload", retries=0, timeout=1)
+    with caplog.at_level(logging.ERROR, logger="notifications"):
+        assert dispatcher._send([{"name": "Economy Pilot"}]) is False
+    assert dispatcher.stats()["failed"] == 1
+    assert "http://127.0.0.1:9/discord_payload" in caplog.text
+
+
+def test_burst_is_posted_in_an_envelope(monkeypatch):
+    posted = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+    monkeypatch.setattr("notifications.requests.post", lambda url, json, timeout: posted.append(json) or Response())
+    dispatcher = DiscordDispatcher("http://127.0.0.1:9/discord_payload")
+    assert dispatcher._send([["Economy Pilot", 1]])
+    assert dispatcher._send([["Economy Pilot", 1], ["Chat Colors", 2]])
+    assert posted == [["Economy Pilot", 1], {"submissions": [["Economy Pilot", 1], ["Chat Colors", 2]]}]
@@ -0,0 +1,18 @@
+import re
+
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/search?count=none", "/my_packages?count=none"])
+def test_page_mode_without_count(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert b"Page 1" in response.data
+
+
+def test_my_packages_cursor_link_keeps_sort(client):
+    response = client.get("/my_packages?cursor=&per_page=1&sort_by=updated_desc")
+    assert response.status_code == 200
+    link = re.search(r'href="(/my_packages\?[^"]+)"', response.get_data(as_text=True))
+    assert link is not None and "sort_by=updated_desc" in link.group(1)
+    assert client.get(link.group(1).replace("&amp;", "&")).status_code == 200
@@ -0,0 +1,90 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from search_index import SearchIndex
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def execute(self, query, args=None):
+        if query == "SELECT id FROM packages":
+            self.result = [{"id": row["id"]} for row in self.rows]
+        elif "last_updated >=" in query:
+            self.result = [row for row in self.rows if row["last_updated"] >= args[0]]
+        else:
+            self.result = list(self.rows)
+
+    def fetchall(self):
+        return self.result
+
+
+class FakePool:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @contextmanager
+    def cursor(self):
+        yield self._cursor
+
+
+def package(package_id, name, tag=None):
+    return {"id": package_id, "name": name, "tag": tag, "last_updated": datetime(2025, 1, package_id)}
+
+
+def test_catalog_change_drops_deleted_packages():
+    rows = [package(1, "Economy Pilot"), package(2, "Economy Shop")]
+    cursor = FakeCursor(rows)
+    index = SearchIndex()
+    index.refresh(cursor, full=True)
+    assert sorted(index.search("economy")) == [1, 2]
+    generation = index.generation
+
+    del rows[1]
+    index.invalidate()
+    index.refresh(cursor)
+
+    assert index.search("economy") == [1]
+    assert 2 not in index.random_ids(seed=7)
+    assert index.generation > generation
+
+
+def test_search_keeps_mid_word_substring_matches():
+    rows = [package(1, "Economy Pilot"), package(2, "Skyblock"), package(3, "Chat Colors")]
+    index = SearchIndex()
+    index.refresh(FakeCursor(rows), full=True)
+
+    assert sorted(index.search("co")) == [1, 3]
+    assert index.search("ky") == [2]
+
+
+def test_search_filters_ignore_case():
+    rows = [package(1, "Economy Pilot", tag="Economy"), package(2, "Economy Shop", tag="Misc")]
+    index = SearchIndex()
+    index.refresh(FakeCursor(rows), full=True)
+
+    assert index.search("economy", {"tag": "economy"}) == [1]
+
+
+def test_background_refresh_polls_and_drops_deleted_packages():
+    rows = [package(1, "Economy Pilot"), package(2, "Economy Shop")]
+    cursor = FakeCursor(rows)
+    polled = threading.Event()
+    index = SearchIndex(refresh_interval=0.01)
+    index.run_in_background(FakePool(cursor), before_refresh=polled.set)
+    index.ensure_fresh(cursor)
+    assert sorted(index.search("economy")) == [1, 2]
+
+    del rows[1]
+    index.invalidate()
+    index.ensure_fresh(cursor)
+
+    assert polled.wait(2)
+    for _ in range(200):
+        if index.search("economy") == [1]:
+            break
+        threading.Event().wait(0.01)
+    assert index.search("economy") == [1]
@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+
+import pymysql
+import pytest
+
+from stats import CatalogStats
+
+
+class FakePool:
+    def __init__(self):
+        self.down = False
+
+    @contextmanager
+    def cursor(self):
+        if self.down:
+            raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+        yield FakeCursor()
+
+
+class FakeCursor:
+    def execute(self, query, args=None):
+        pass
+
+    def fetchall(self):
+        return [{"tag": "Economy", "license": "MIT", "project_type": "plugin", "server_platform": "endstone",
+                 "total_count": 3}]
+
+
+def test_refresh_failure_keeps_serving_loaded_counts():
+    pool = FakePool()
+    stats = CatalogStats(refresh_interval=60)
+    stats.ensure_fresh(pool)
+    assert stats.package_count == 3
+
+    pool.down = True
+    stats.invalidate()
+    stats.ensure_fresh(pool)
+    assert stats.package_count == 3
+
+
+def test_refresh_failure_before_first_load_raises():
+    pool = FakePool()
+    pool.down = True
+    with pytest.raises(pymysql.MySQLError):
+        CatalogStats().ensure_fresh(pool)